@@ -20,3 +20,111 @@ APP_SECRET_KEY = "change-me"
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "change-me"
 ACCESS_TOKEN_EXPIRES_IN = 604800  # 7 days
+# 已验证 token 的进程内缓存：有效期（秒）与最大条数，用户信息变更时会主动失效
+AUTH_CACHE_TTL = 60
+AUTH_CACHE_SIZE = 1024
+# 密码哈希：PBKDF2 迭代次数（修改后用户下次登录自动重新哈希）、哈希进程数、同时排队上限
+PASSWORD_HASH_ITERATIONS = 200000
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_MAX_PENDING = 16
+
+# =========================
+# 发布队列配置
+# =========================
+# /postVideo 只负责写入任务表，由后台 worker 线程领取并执行上传
+PUBLISH_WORKERS = 4
+# 并发上限：全局 / 单平台（key 为平台 type：1 小红书 2 视频号 3 抖音 4 快手）/ 单账号
+PUBLISH_MAX_CONCURRENCY = 4
+PUBLISH_PLATFORM_CONCURRENCY = {1: 2, 2: 2, 3: 2, 4: 2}
+PUBLISH_ACCOUNT_CONCURRENCY = 1
+# 是否在后端进程内运行发布 worker；设为 False 时后端只写入任务，
+# 由一个或多个 `python -m sau_worker` 进程领取并上传；这些进程必须与数据库在同一台机器上运行
+# （SQLite WAL 不支持跨主机共享，数据库位于网络文件系统时 worker 会拒绝启动）
+PUBLISH_EMBEDDED_WORKERS = True
+# 独立 worker 空闲时的轮询间隔（秒）
+PUBLISH_WORKER_POLL_INTERVAL = 2.0
+# worker 领取条目后的租约时长（秒），进程崩溃后超过该时长的条目会自动重新排队
+PUBLISH_LEASE_SECONDS = 120
+# 失败重试策略：key 为平台 type，"default" 为兜底
+# 第 n 次失败后等待 min(max_delay, base_delay * 2^(n-1)) 秒（±jitter 随机抖动），最多尝试 max_attempts 次
+PUBLISH_RETRY_POLICY = {
+    "default": {"max_attempts": 3, "base_delay": 30, "max_delay": 600, "jitter": 0.2},
+}
+# 发布限速（所有 worker 进程共享，状态存于数据库）：key 为平台 type，"default" 为兜底
+# uploads_per_hour: 单账号每小时最多上传数（0 不限），burst: 允许的突发数
+# platform_sessions: 该平台同时进行的上传数上限（0 不限）
+# 账号令牌用尽时，其待发布条目会推迟到下一个令牌可用的时间，而不是直接失败
+PUBLISH_RATE_LIMITS = {
+    "default": {"uploads_per_hour": 6, "burst": 2, "platform_sessions": 0},
+}
+# 发布熔断：key 为平台 type，"default" 为兜底（状态存于数据库，所有 worker 进程共享）
+# 最近 window 次上传中失败率 >= failure_rate（至少 min_calls 次）即熔断，剩余条目转为 deferred；
+# open_seconds 秒后放行一次试探上传，成功则恢复全部 deferred 条目；per_account=True 时按账号熔断
+PUBLISH_CIRCUIT_BREAKER = {
+    "default": {"window": 10, "min_calls": 5, "failure_rate": 0.6, "open_seconds": 900, "per_account": False},
+}
+# 发布前预检：检查视频文件是否存在、大小，以及账号 cookie 是否有效
+# PREFLIGHT_ENABLED 为 /postVideo 的默认值（请求体 preflight 字段优先；dropInvalid=true 时剔除无效条目而不是整体拒绝）
+PREFLIGHT_ENABLED = False
+PREFLIGHT_CONCURRENCY = 4
+PREFLIGHT_COOKIE_TIMEOUT = 60
+# 视频大小上限（MB）：key 为平台 type，"default" 为兜底，0 表示不限
+PREFLIGHT_MAX_FILE_MB = {"default": 0}
+# 调度顺序：先按任务优先级（请求体 priority，取值 [-PUBLISH_MAX_PRIORITY, PUBLISH_MAX_PRIORITY]，越大越先），
+# 同优先级内按用户加权公平轮转；PUBLISH_USER_WEIGHTS 的 key 为 user_id，未配置的用户权重为 1
+PUBLISH_MAX_PRIORITY = 10
+PUBLISH_USER_WEIGHTS = {}
+# 计算用户已占用份额的回看窗口（秒）；PUBLISH_FAIR_ACROSS_TASKS=True 时同一用户的多个任务之间也轮转
+PUBLISH_FAIR_WINDOW_SECONDS = 3600
+PUBLISH_FAIR_ACROSS_TASKS = False
+# 资源管控：同时存在的浏览器会话（上传 + 登录 + 预检 cookie 校验）、进程总内存（MB，含浏览器子进程）、系统 CPU（%）上限，0 表示不限
+# 超过上限的上传留在队列中等待，登录排队等待；排队的登录超过 RESOURCE_MAX_WAITING 时 /login 返回 429
+# 内存达到上限时会先关闭浏览器池中空闲的浏览器
+RESOURCE_MAX_SESSIONS = 6
+RESOURCE_MAX_RSS_MB = 0
+RESOURCE_MAX_CPU_PERCENT = 0
+RESOURCE_MAX_WAITING = 8
+RESOURCE_RETRY_AFTER = 10
+# 等待上传的条目总数上限（pending + deferred），超过后 /postVideo 与 /postVideoBatch 返回 429；0 表示不限
+PUBLISH_MAX_QUEUED_ITEMS = 1000
+# 发布状态写入攒批：最长等待（秒）与单批最大条数
+STATUS_FLUSH_INTERVAL = 0.2
+STATUS_MAX_BATCH = 200
+
+# 浏览器池：每个浏览器最多服务多少次上传后重启；浏览器进程总内存（MB）超过阈值时全部回收
+BROWSER_POOL_MAX_USES = 20
+BROWSER_POOL_MAX_RSS_MB = 2048
+
+# 分片上传（/uploads）：默认分片大小与分片上限（MB，单个分片须小于 MAX_CONTENT_LENGTH）
+UPLOAD_CHUNK_SIZE_MB = 8
+UPLOAD_MAX_CHUNK_SIZE_MB = 64
+# 单个文件大小上限（MB）；未完成的上传保留多少小时，过期后连同半成品文件一起清理
+UPLOAD_MAX_FILE_MB = 8192
+UPLOAD_SESSION_TTL_HOURS = 24
+# 素材探测（时长、分辨率、码率、编码、moov 位置）：后台线程数（0 表示不探测）、ffprobe 路径与单次超时（秒）
+# 未安装 ffprobe 时使用内置的 MP4 解析；已有素材会在后台逐条补全
+MEDIA_PROBE_WORKERS = 1
+FFPROBE_PATH = "ffprobe"
+MEDIA_PROBE_TIMEOUT = 30
+# 素材缩略图（/thumb/<id>，缓存在 thumbCache/）：ffmpeg 路径、允许的宽度（第一个为默认）、生成超时（秒）与同时生成数
+FFMPEG_PATH = "ffmpeg"
+THUMB_WIDTHS = (320, 160, 640)
+THUMB_TIMEOUT = 60
+THUMB_CONCURRENCY = 2
+# 预览雪碧图的帧数与每行帧数
+THUMB_SPRITE_FRAMES = 10
+THUMB_SPRITE_COLUMNS = 5
+
+# /getFile 与 /download 的发送方式："direct" 由后端发送（支持 Range、ETag、304，WSGI 服务器支持时零拷贝 sendfile）；
+# 部署在 nginx 后面时用 "x-accel"，后端只返回 X-Accel-Redirect，由 nginx 发送文件，需配置：
+#   location /protected-videos/ { internal; alias /path/to/project/videoFile/; }
+# Apache mod_xsendfile / lighttpd 用 "x-sendfile"
+FILE_SERVE_MODE = "direct"
+FILE_SERVE_ACCEL_PREFIX = "/protected-videos/"
+
+# =========================
+# SQLite 配置
+# =========================
+# 数据库以 WAL 模式运行；写锁等待超时（毫秒）与连接池空闲连接数
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_POOL_SIZE = 8
@@ -0,0 +1,59 @@
+import asyncio
+import atexit
+import threading
+
+
+class AsyncRuntime:
+    """
+    One asyncio loop running forever on a dedicated thread.
+
+    Publish uploads and account logins submit their coroutines here instead of
+    spinning up a loop per call, so loop-bound resources (the browser pool,
+    HTTP sessions, asyncio semaphores) can be shared between them. Callers on
+    Flask / worker threads get a concurrent.futures.Future back.
+    """
+
+    def __init__(self, name="async-runtime"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        self.start()
+        return self._loop
+
+    def start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run_forever, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run_forever(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def stop(self, timeout=10):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None:
+                return
+            self._loop = None
+            self._thread = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+    def submit(self, coro):
+        """Schedule coro on the runtime loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run coro on the runtime loop and block the calling thread for its result."""
+        return self.submit(coro).result(timeout)
+
+
+runtime = AsyncRuntime()
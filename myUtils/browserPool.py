@@ -0,0 +1,254 @@
+import asyncio
+import atexit
+import json
+import threading
+
+import psutil
+from playwright.async_api import async_playwright
+
+import conf
+from myUtils.asyncRuntime import runtime
+
+# 单个浏览器最多承载多少次上传后回收；浏览器进程总内存超过阈值时也会回收
+BROWSER_POOL_MAX_USES = getattr(conf, "BROWSER_POOL_MAX_USES", 20)
+BROWSER_POOL_MAX_RSS_MB = getattr(conf, "BROWSER_POOL_MAX_RSS_MB", 2048)
+
+
+def _browser_rss_mb():
+    """RSS of every child process (playwright driver + chromium) in MB."""
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / (1024 * 1024)
+
+
+class _PooledBrowser:
+    def __init__(self, key, browser):
+        self.key = key
+        self.browser = browser
+        self.uses = 0
+        self.leases = 0
+        self.retiring = False
+
+
+class _BrowserLease:
+    """
+    What an uploader gets back from chromium.launch(): behaves like a Browser,
+    but close() only closes the contexts this upload opened and hands the
+    browser back to the pool.
+    """
+
+    def __init__(self, pool, pooled):
+        self._pool = pool
+        self._pooled = pooled
+        self._contexts = []
+        self._closed = False
+
+    async def new_context(self, **kwargs):
+        context = await self._pooled.browser.new_context(**kwargs)
+        self._contexts.append(context)
+        return context
+
+    async def new_page(self, **kwargs):
+        page = await self._pooled.browser.new_page(**kwargs)
+        self._contexts.append(page.context)
+        return page
+
+    async def close(self, **kwargs):
+        if self._closed:
+            return
+        self._closed = True
+        for context in self._contexts:
+            try:
+                await context.close()
+            except Exception:
+                pass
+        self._contexts = []
+        await self._pool._release(self._pooled)
+
+    def __getattr__(self, name):
+        return getattr(self._pooled.browser, name)
+
+
+class _PooledChromium:
+    def __init__(self, session):
+        self._session = session
+
+    async def launch(self, **kwargs):
+        return await self._session.lease(kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session.playwright.chromium, name)
+
+
+class _UploadSession:
+    """Stand-in for the Playwright object passed to uploader.upload(playwright)."""
+
+    def __init__(self, pool, playwright):
+        self._pool = pool
+        self.playwright = playwright
+        self.chromium = _PooledChromium(self)
+        self._leases = []
+
+    async def lease(self, launch_kwargs):
+        pooled = await self._pool._acquire(launch_kwargs)
+        lease = _BrowserLease(self._pool, pooled)
+        self._leases.append(lease)
+        return lease
+
+    async def release(self):
+        # uploaders that bail out early never call browser.close()
+        for lease in self._leases:
+            await lease.close()
+        self._leases = []
+
+    def __getattr__(self, name):
+        return getattr(self.playwright, name)
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium instances shared by all uploads in this process.
+
+    Browsers are keyed by their launch options (headless, executable_path,
+    proxy ...). Every upload still gets its own fresh context, created by the
+    uploader with the account's cookie file as storage_state. A browser is
+    retired once it served BROWSER_POOL_MAX_USES uploads or when the browser
+    processes together exceed BROWSER_POOL_MAX_RSS_MB, and is closed as soon as
+    its last upload finishes.
+
+    All browser work happens on the shared AsyncRuntime loop.
+    """
+
+    def __init__(self, max_uses=BROWSER_POOL_MAX_USES, max_rss_mb=BROWSER_POOL_MAX_RSS_MB, runtime=runtime):
+        self.max_uses = max(1, int(max_uses))
+        self.max_rss_mb = max_rss_mb
+        self._runtime = runtime
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._lock = None
+        self._playwright = None
+        self._browsers = {}
+        self._launched = 0
+        self._trimming = None
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._runtime.start()
+            # registered after the runtime's own hook, so atexit closes browsers first
+            atexit.register(self.stop)
+            self._started = True
+
+    def stop(self):
+        if not self._started or self._playwright is None:
+            return
+        try:
+            self._runtime.run(self._shutdown(), timeout=30)
+        except Exception as e:
+            print(f"⚠️ 关闭浏览器池失败: {e}")
+
+    def submit_upload(self, app):
+        """Schedule one uploader instance on the runtime loop; returns a concurrent Future."""
+        self.start()
+        return self._runtime.submit(self._run_upload(app))
+
+    def trim_idle(self):
+        """
+        Close every pooled browser no upload is using. Returns at once; the
+        browsers are closed on the runtime loop. Called by the resource
+        governor when memory is over its ceiling, since idle browsers are
+        otherwise kept until their next release.
+        """
+        if self._playwright is None or (self._trimming is not None and not self._trimming.done()):
+            return
+        self._trimming = self._runtime.submit(self._close_idle())
+
+    def stats(self):
+        return {
+            "browsers": len(self._browsers),
+            "launched_total": self._launched,
+            "leases": sum(p.leases for p in self._browsers.values()),
+        }
+
+    async def _run_upload(self, app):
+        if not hasattr(app, "upload"):
+            # uploader without an upload(playwright) entry point manages its own browser
+            return await app.main()
+        session = _UploadSession(self, await self._ensure_playwright())
+        try:
+            return await app.upload(session)
+        finally:
+            await session.release()
+
+    async def _ensure_playwright(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            return self._playwright
+
+    async def _acquire(self, launch_kwargs):
+        key = json.dumps(launch_kwargs, sort_keys=True, default=str)
+        async with self._lock:
+            pooled = self._browsers.get(key)
+            if pooled is not None and (pooled.retiring or not pooled.browser.is_connected()):
+                self._retire(pooled)
+                pooled = None
+            if pooled is None:
+                browser = await self._playwright.chromium.launch(**launch_kwargs)
+                pooled = _PooledBrowser(key, browser)
+                self._browsers[key] = pooled
+                self._launched += 1
+            pooled.uses += 1
+            pooled.leases += 1
+            if pooled.uses >= self.max_uses:
+                pooled.retiring = True
+            return pooled
+
+    async def _release(self, pooled):
+        async with self._lock:
+            pooled.leases -= 1
+            if self.max_rss_mb and _browser_rss_mb() > self.max_rss_mb:
+                for p in self._browsers.values():
+                    p.retiring = True
+            if pooled.retiring and pooled.leases <= 0:
+                self._retire(pooled)
+                await self._close_browser(pooled)
+
+    async def _close_idle(self):
+        async with self._lock:
+            idle = [p for p in self._browsers.values() if p.leases <= 0]
+            for pooled in idle:
+                self._retire(pooled)
+        for pooled in idle:
+            await self._close_browser(pooled)
+        if idle:
+            print(f"♻️ 内存超限，已关闭 {len(idle)} 个空闲浏览器")
+
+    def _retire(self, pooled):
+        pooled.retiring = True
+        if self._browsers.get(pooled.key) is pooled:
+            del self._browsers[pooled.key]
+
+    async def _close_browser(self, pooled):
+        try:
+            await pooled.browser.close()
+        except Exception:
+            pass
+
+    async def _shutdown(self):
+        for pooled in list(self._browsers.values()):
+            await self._close_browser(pooled)
+        self._browsers = {}
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+browser_pool = BrowserPool()
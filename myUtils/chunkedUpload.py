@@ -0,0 +1,271 @@
+import os
+import threading
+import time
+import uuid
+
+import conf
+from myUtils import materialStore
+
+# 分片上传：默认分片大小（MB，客户端可在上限内自选）、分片上限（受 MAX_CONTENT_LENGTH 约束）
+UPLOAD_CHUNK_SIZE_MB = getattr(conf, "UPLOAD_CHUNK_SIZE_MB", 8)
+UPLOAD_MAX_CHUNK_SIZE_MB = getattr(conf, "UPLOAD_MAX_CHUNK_SIZE_MB", 64)
+# 单个文件大小上限（MB）与未完成上传的保留时间（小时），过期的会话连同半成品文件一起清理
+UPLOAD_MAX_FILE_MB = getattr(conf, "UPLOAD_MAX_FILE_MB", 8192)
+UPLOAD_SESSION_TTL_HOURS = getattr(conf, "UPLOAD_SESSION_TTL_HOURS", 24)
+
+# request bodies are copied to the file in blocks of this size
+COPY_BLOCK_SIZE = materialStore.COPY_BLOCK_SIZE
+
+
+class UploadError(Exception):
+    """Client-facing upload protocol error; status is the HTTP status to answer with."""
+
+    def __init__(self, msg, status=400):
+        super().__init__(msg)
+        self.status = status
+
+
+def video_dir():
+    return materialStore.video_dir()
+
+
+class _PrefixDigest:
+    """
+    Running digest over the contiguous prefix of one upload.
+
+    The chunk that extends the prefix is hashed while it streams to disk;
+    chunks arriving ahead of it are read back once when the prefix reaches
+    them. `busy` marks the single thread allowed to touch the hasher.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hasher = materialStore.new_hasher()
+        self.next_index = 0
+        self.busy = False
+        self.written = set()
+
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def _digest_state(upload_id, pop=False):
+    with _digests_lock:
+        if pop:
+            return _digests.pop(upload_id, None) or _PrefixDigest()
+        return _digests.setdefault(upload_id, _PrefixDigest())
+
+
+def _read_chunk(session, index, hasher):
+    with open(video_dir() / session["file_path"], "rb") as f:
+        f.seek(index * session["chunk_size"])
+        remaining = _expected_length(session, index)
+        while remaining > 0:
+            block = f.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+
+
+def _advance(session, state, index):
+    """Record a written chunk and hash every chunk that now continues the prefix."""
+    with state.lock:
+        state.written.add(index)
+        if state.busy:
+            # the thread holding the hasher advances past this chunk itself
+            return
+        state.busy = True
+    while True:
+        with state.lock:
+            if state.next_index not in state.written:
+                state.busy = False
+                return
+            index = state.next_index
+        try:
+            _read_chunk(session, index, state.hasher)
+        except BaseException:
+            # a half-read chunk spoils the running digest; finish_digest() starts over
+            _digest_state(session["id"], pop=True)
+            raise
+        with state.lock:
+            state.next_index = index + 1
+
+
+def _chunk_count(size, chunk_size):
+    return max(1, -(-size // chunk_size))
+
+
+def _expected_length(session, index):
+    if index == session["total_chunks"] - 1:
+        return session["size"] - index * session["chunk_size"]
+    return session["chunk_size"]
+
+
+def create_session(conn, user_id, filename, size, chunk_size=None):
+    """
+    Start a resumable upload. The target file is created (sparse) at its final
+    size right away so chunks can be written in place in any order.
+    """
+    size = int(size)
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if size > UPLOAD_MAX_FILE_MB * 1024 * 1024:
+        raise UploadError(f"file exceeds {UPLOAD_MAX_FILE_MB}MB", 413)
+    chunk_size = int(chunk_size or UPLOAD_CHUNK_SIZE_MB * 1024 * 1024)
+    chunk_size = max(256 * 1024, min(chunk_size, UPLOAD_MAX_CHUNK_SIZE_MB * 1024 * 1024))
+
+    upload_id = uuid.uuid4().hex
+    # stored under its digest on complete, see materialStore.adopt()
+    final_name = f".upload-{upload_id}"
+    path = video_dir() / final_name
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+    conn.execute(
+        """
+        INSERT INTO upload_sessions (id, user_id, filename, file_path, size, chunk_size, total_chunks, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (upload_id, user_id, filename, final_name, size, chunk_size, _chunk_count(size, chunk_size), time.time()),
+    )
+    return {
+        "upload_id": upload_id,
+        "chunk_size": chunk_size,
+        "total_chunks": _chunk_count(size, chunk_size),
+        "size": size,
+    }
+
+
+def get_session(conn, upload_id, user_id=None):
+    row = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (upload_id,)).fetchone()
+    if row is None or (user_id is not None and row["user_id"] is not None and row["user_id"] != user_id):
+        raise UploadError("upload not found", 404)
+    return dict(row)
+
+
+def received_chunks(conn, upload_id):
+    rows = conn.execute(
+        "SELECT chunk_index FROM upload_chunks WHERE upload_id = ? ORDER BY chunk_index", (upload_id,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def progress(conn, session):
+    """
+    offset: bytes received contiguously from the start (where a sequential
+    client resumes); missing: every chunk index still to send.
+    """
+    received = set(received_chunks(conn, session["id"]))
+    contiguous = 0
+    while contiguous in received:
+        contiguous += 1
+    return {
+        "upload_id": session["id"],
+        "size": session["size"],
+        "chunk_size": session["chunk_size"],
+        "offset": min(session["size"], contiguous * session["chunk_size"]),
+        "received": len(received),
+        "total_chunks": session["total_chunks"],
+        "missing": [i for i in range(session["total_chunks"]) if i not in received],
+    }
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Copy one chunk from the request stream straight into the target file,
+    hashing it on the way when it extends the contiguous prefix. Returns the
+    chunk index; the caller records it once the write succeeded.
+    """
+    offset = int(offset)
+    if offset < 0 or offset % session["chunk_size"] or offset >= session["size"]:
+        raise UploadError("offset must be a chunk boundary inside the file")
+    index = offset // session["chunk_size"]
+    expected = _expected_length(session, index)
+    if length is None or int(length) != expected:
+        raise UploadError(f"chunk {index} must be exactly {expected} bytes")
+
+    state = _digest_state(session["id"])
+    with state.lock:
+        inline = not state.busy and state.next_index == index
+        if inline:
+            state.busy = True
+            before = state.hasher.copy()
+
+    written = 0
+    try:
+        with open(video_dir() / session["file_path"], "r+b") as f:
+            f.seek(offset)
+            while written < expected:
+                block = stream.read(min(COPY_BLOCK_SIZE, expected - written))
+                if not block:
+                    break
+                f.write(block)
+                if inline:
+                    state.hasher.update(block)
+                written += len(block)
+    finally:
+        if inline:
+            with state.lock:
+                if written == expected:
+                    state.next_index = index + 1
+                else:
+                    state.hasher = before
+                state.busy = False
+    if written != expected:
+        # nothing is recorded, so the client simply sends this chunk again
+        raise UploadError(f"chunk {index} was cut off after {written} bytes")
+    _advance(session, state, index)
+    return index
+
+
+def finish_digest(session):
+    """
+    Digest of a complete upload. Normally only the tail past the hashed
+    prefix is left to read; after a restart the whole file is read once.
+    """
+    state = _digest_state(session["id"], pop=True)
+    for index in range(state.next_index, session["total_chunks"]):
+        _read_chunk(session, index, state.hasher)
+    return state.hasher.hexdigest()
+
+
+def adoptable(session):
+    """
+    Path to hand to materialStore.adopt() on complete: a hard link to the
+    upload's file, so the file itself stays until the commit and a complete
+    that fails can be retried. Where links are unsupported it is the file.
+    """
+    path = video_dir() / session["file_path"]
+    link = path.with_name(f".incoming-{uuid.uuid4().hex}")
+    try:
+        os.link(path, link)
+    except OSError:
+        return path
+    return link
+
+
+def remove_file(session):
+    try:
+        os.remove(video_dir() / session["file_path"])
+    except FileNotFoundError:
+        pass
+
+
+def discard(conn, session):
+    _digest_state(session["id"], pop=True)
+    conn.execute("DELETE FROM upload_chunks WHERE upload_id = ?", (session["id"],))
+    conn.execute("DELETE FROM upload_sessions WHERE id = ?", (session["id"],))
+    remove_file(session)
+
+
+def purge_expired(conn, now=None):
+    """Drop unfinished uploads older than UPLOAD_SESSION_TTL_HOURS together with their partial files."""
+    now = time.time() if now is None else now
+    rows = conn.execute(
+        "SELECT * FROM upload_sessions WHERE created_at < ?", (now - UPLOAD_SESSION_TTL_HOURS * 3600,)
+    ).fetchall()
+    for row in rows:
+        discard(conn, dict(row))
+    return len(rows)
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+from pathlib import Path
+from queue import Empty, Full, LifoQueue
+
+import conf
+from conf import BASE_DIR
+
+DB_PATH = Path(BASE_DIR / "db" / "database.db")
+
+# 写锁等待时间（毫秒），超过后才抛出 database is locked
+SQLITE_BUSY_TIMEOUT_MS = getattr(conf, "SQLITE_BUSY_TIMEOUT_MS", 5000)
+# 连接池中最多保留的空闲连接数
+SQLITE_POOL_SIZE = getattr(conf, "SQLITE_POOL_SIZE", 8)
+# 每个连接缓存的预编译语句数
+SQLITE_CACHED_STATEMENTS = 256
+
+
+# filesystem types on which SQLite locking / WAL shared memory cannot be trusted
+NETWORK_FS_TYPES = ("nfs", "nfs4", "cifs", "smbfs", "smb3", "9p", "fuse.sshfs", "afs", "ceph", "glusterfs", "lustre")
+
+
+def network_filesystem(path):
+    """
+    Filesystem type when path lives on a network mount, else None.
+    Reads /proc/mounts, so on other platforms it always answers None.
+    """
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return None
+    target = str(Path(path).resolve())
+    best, best_type = "", None
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (target == mount_point or target.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) >= len(best):
+            best, best_type = mount_point, fs_type
+    return best_type if best_type in NETWORK_FS_TYPES else None
+
+
+class _PooledConnection:
+    """
+    Context manager around one pooled connection.
+
+    Mirrors `with sqlite3.connect(...) as conn`: commit on success, rollback on
+    error. The connection then goes back to the pool instead of being dropped,
+    so its prepared-statement cache stays warm.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = None
+
+    def __enter__(self):
+        self._conn = self._pool.acquire()
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        conn, self._conn = self._conn, None
+        try:
+            if exc_type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return False
+        self._pool.release(conn)
+        return False
+
+
+class ConnectionPool:
+    """
+    Small pool of SQLite connections in WAL mode.
+
+    WAL lets dashboard reads run while a publish worker writes; busy_timeout
+    makes a writer wait for the lock instead of failing straight away. A
+    connection is only ever used by one thread at a time (checkout/return), so
+    check_same_thread can be relaxed safely.
+    """
+
+    def __init__(self, path, size=SQLITE_POOL_SIZE, busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS):
+        self.path = path
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self._idle = LifoQueue(maxsize=max(1, int(size)))
+        self._wal_lock = threading.Lock()
+        self._wal_ready = False
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row
+        if not self._wal_ready:
+            with self._wal_lock:
+                # journal_mode is persisted in the database file, one switch is enough
+                conn.execute("PRAGMA journal_mode=WAL")
+                self._wal_ready = True
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        # NORMAL is durable across application crashes in WAL mode, and skips an fsync per commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            return self._open()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def connection(self):
+        return _PooledConnection(self)
+
+
+pool = ConnectionPool(DB_PATH)
+
+
+def connect():
+    """`with connect() as conn:` – a pooled connection for the duration of the block."""
+    return pool.connection()
@@ -0,0 +1,163 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, parse_date
+from werkzeug.wsgi import wrap_file
+
+import conf
+
+# 视频文件的发送方式：
+#   "direct"     - 由本进程发送（支持 Range / ETag / 304，WSGI 服务器支持时走 sendfile 零拷贝）
+#   "x-accel"    - 交给 nginx：返回 X-Accel-Redirect: FILE_SERVE_ACCEL_PREFIX + 文件名（需配置 internal location）
+#   "x-sendfile" - 交给 Apache mod_xsendfile / lighttpd：返回 X-Sendfile: 绝对路径
+FILE_SERVE_MODE = getattr(conf, "FILE_SERVE_MODE", "direct")
+FILE_SERVE_ACCEL_PREFIX = getattr(conf, "FILE_SERVE_ACCEL_PREFIX", "/protected-videos/")
+
+# bounded ranges are streamed in blocks of this size
+COPY_BLOCK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(st):
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak comparison, as If-None-Match requires
+    tags = [t.strip() for t in header.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+
+def _not_modified(st, etag):
+    if request.headers.get("If-None-Match"):
+        return _etag_matches(request.headers["If-None-Match"], etag)
+    since = parse_date(request.headers.get("If-Modified-Since"))
+    return since is not None and int(st.st_mtime) <= since.timestamp()
+
+
+def _parse_range(header, size):
+    """
+    (start, end) for a single byte range, None to send the whole file, or
+    "unsatisfiable". Multi-range requests are answered with the whole file,
+    which RFC 9110 allows.
+    """
+    m = _RANGE_RE.match((header or "").replace(" ", ""))
+    if m is None:
+        return None
+    first, last = m.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "unsatisfiable"
+    return start, end
+
+
+def _range_applies(st, etag):
+    """If-Range: only honour Range while the client's copy is still current."""
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    since = parse_date(if_range)
+    return since is not None and int(st.st_mtime) <= since.timestamp()
+
+
+def _content_disposition(name):
+    ascii_name = name.encode("ascii", "ignore").decode() or "download"
+    ascii_name = ascii_name.replace("\\", "").replace('"', "")
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(name)}"
+
+
+def _iter_range(f, start, length):
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(COPY_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        f.close()
+
+
+def serve_file(base_dir, name, as_attachment=False, mode=None):
+    """
+    Response for base_dir/name with Range, ETag / Last-Modified and 304
+    support. Returns None when the file does not exist (or escapes
+    base_dir) so the route can answer in its own error format.
+
+    Open-ended ranges, which players send when seeking, hand the open file
+    to wsgi.file_wrapper so servers such as gunicorn use sendfile(2);
+    bounded ranges are streamed in blocks. In "x-accel" / "x-sendfile" mode
+    only the headers are produced and the front server sends the bytes.
+    """
+    base = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(base, name))
+    if os.path.commonpath([base, path]) != base or not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    etag = _etag(st)
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(st.st_mtime),
+        "Accept-Ranges": "bytes",
+        # revalidation is a stat() and a 304, far cheaper than a refetch
+        "Cache-Control": "private, no-cache",
+    }
+    if as_attachment:
+        headers["Content-Disposition"] = _content_disposition(os.path.basename(name))
+
+    if _not_modified(st, etag):
+        return Response(status=304, headers=headers)
+
+    mode = (mode or FILE_SERVE_MODE).lower()
+    if mode == "x-accel":
+        relative = os.path.relpath(path, base).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = FILE_SERVE_ACCEL_PREFIX.rstrip("/") + "/" + quote(relative)
+        return Response(status=200, headers=headers, mimetype=mimetype)
+    if mode == "x-sendfile":
+        headers["X-Sendfile"] = path
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    size = st.st_size
+    byte_range = _parse_range(request.headers.get("Range"), size) if _range_applies(st, etag) else None
+    if byte_range == "unsatisfiable":
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    start, end = byte_range or (0, size - 1)
+    length = max(0, end - start + 1)
+    f = open(path, "rb")
+    if end == size - 1:
+        # runs to EOF: the server may sendfile() from the current offset
+        f.seek(start)
+        body = wrap_file(request.environ, f, COPY_BLOCK_SIZE)
+    else:
+        body = _iter_range(f, start, length)
+
+    response = Response(body, status=206 if byte_range else 200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = length
+    if byte_range:
+        response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
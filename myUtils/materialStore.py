@@ -0,0 +1,124 @@
+import hashlib
+import os
+import time
+import uuid
+from pathlib import Path
+
+from conf import BASE_DIR
+
+# digest used to name stored materials (videoFile/<digest><ext>)
+HASH_ALGORITHM = "sha256"
+# uploads are copied to disk and hashed in blocks of this size
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def video_dir():
+    return Path(BASE_DIR / "videoFile")
+
+
+def new_hasher():
+    return hashlib.new(HASH_ALGORITHM)
+
+
+def blob_name(digest, filename):
+    """Flat file name of a blob; the extension is kept so players and uploaders recognise the format."""
+    return f"{digest}{Path(str(filename)).suffix.lower()}"
+
+
+def _unlink(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def save_stream(stream):
+    """
+    Copy an upload stream into videoFile while hashing it, in a single pass.
+    Returns (temp_path, digest, size); hand the temp file to adopt().
+    """
+    temp_path = video_dir() / f".incoming-{uuid.uuid4().hex}"
+    hasher = new_hasher()
+    size = 0
+    try:
+        with open(temp_path, "wb") as f:
+            while True:
+                block = stream.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                hasher.update(block)
+                f.write(block)
+                size += len(block)
+    except BaseException:
+        _unlink(temp_path)
+        raise
+    return temp_path, hasher.hexdigest(), size
+
+
+def adopt(conn, temp_path, digest, filename, size):
+    """
+    Move a fully written file into the store and take one reference to it.
+
+    When the same content is already stored the new copy is dropped and the
+    existing blob is shared. Must run inside a write transaction (BEGIN
+    IMMEDIATE) so a concurrent release() cannot remove the blob in between.
+    Returns (file_path, duplicate).
+    """
+    row = conn.execute("SELECT file_path FROM material_blobs WHERE digest = ?", (digest,)).fetchone()
+    if row is not None and (video_dir() / row["file_path"]).exists():
+        _unlink(temp_path)
+        conn.execute("UPDATE material_blobs SET refcount = refcount + 1 WHERE digest = ?", (digest,))
+        return row["file_path"], True
+
+    # a blob whose file went missing is restored under its stored name, which file_records rows point at
+    file_path = row["file_path"] if row is not None else blob_name(digest, filename)
+    os.replace(temp_path, video_dir() / file_path)
+    try:
+        if row is not None:
+            conn.execute("UPDATE material_blobs SET refcount = refcount + 1 WHERE digest = ?", (digest,))
+        else:
+            conn.execute(
+                """
+                INSERT INTO material_blobs (digest, file_path, size, refcount, created_at)
+                VALUES (?, ?, ?, 1, ?)
+                """,
+                (digest, file_path, int(size), time.time()),
+            )
+    except BaseException:
+        # no row points at the file, so hand it back to the caller
+        os.replace(video_dir() / file_path, temp_path)
+        raise
+    return file_path, False
+
+
+def release(conn, digest):
+    """
+    Drop one reference. Must run inside a write transaction. When it was
+    the last one the blob row is deleted and its file_path returned; the
+    file itself is left for remove_unreferenced() after the commit, so a
+    rollback never leaves rows pointing at a missing file.
+    """
+    row = conn.execute("SELECT file_path, refcount FROM material_blobs WHERE digest = ?", (digest,)).fetchone()
+    if row is None:
+        return None
+    if int(row["refcount"]) > 1:
+        conn.execute("UPDATE material_blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,))
+        return None
+    conn.execute("DELETE FROM material_blobs WHERE digest = ?", (digest,))
+    return row["file_path"]
+
+
+def remove_unreferenced(conn, file_path):
+    """
+    Delete a file released earlier, unless an upload adopted the same
+    content again in the meantime. Takes the write lock itself (adopt()
+    places files under it too) and commits. Returns True when removed.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM material_blobs WHERE file_path = ?", (file_path,)).fetchone():
+            return False
+        _unlink(video_dir() / file_path)
+        return True
+    finally:
+        conn.commit()
@@ -0,0 +1,325 @@
+import json
+import os
+import shutil
+import struct
+import subprocess
+import threading
+
+import conf
+from myUtils.materialStore import video_dir
+
+# 素材探测：后台线程数（0 表示不探测）、ffprobe 可执行文件与单次探测超时（秒）
+MEDIA_PROBE_WORKERS = getattr(conf, "MEDIA_PROBE_WORKERS", 1)
+FFPROBE_PATH = getattr(conf, "FFPROBE_PATH", "ffprobe")
+MEDIA_PROBE_TIMEOUT = getattr(conf, "MEDIA_PROBE_TIMEOUT", 30)
+
+# the moov box is read into memory for the fallback parser; larger ones are rejected
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+# boxes whose children are walked by the fallback parser
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+PROBE_COLUMNS = ("duration", "width", "height", "bitrate", "codec", "moov_offset")
+
+
+class ProbeError(Exception):
+    """The file could not be probed by any means."""
+
+
+def _top_level_boxes(f, file_size):
+    """Yield (type, offset, header_size, box_size) for every top-level box."""
+    offset = 0
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        header = f.read(16)
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - offset
+        if size < header_size:
+            raise ProbeError(f"corrupt box {box_type!r} at {offset}")
+        yield box_type, offset, header_size, size
+        offset += size
+
+
+def _child_boxes(data, start, end):
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[pos:pos + 8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size or pos + size > end:
+            return
+        yield box_type, pos + header_size, pos + size
+        pos += size
+
+
+def _parse_moov(data):
+    """duration / width / height / codec from an in-memory moov payload."""
+    info = {}
+    tracks = []
+
+    def walk(start, end, track):
+        for box_type, body, box_end in _child_boxes(data, start, end):
+            payload = data[body:box_end]
+            if box_type == b"trak":
+                track = {}
+                tracks.append(track)
+                walk(body, box_end, track)
+            elif box_type in CONTAINER_BOXES:
+                walk(body, box_end, track)
+            elif box_type == b"mvhd" and len(payload) >= 32:
+                if payload[0] == 1:
+                    timescale, duration = struct.unpack(">IQ", payload[20:32])
+                else:
+                    timescale, duration = struct.unpack(">II", payload[12:20])
+                if timescale:
+                    info["duration"] = duration / timescale
+            elif box_type == b"tkhd" and track is not None:
+                pos = 88 if payload[:1] == b"\x01" else 76
+                if len(payload) >= pos + 8:
+                    width, height = struct.unpack(">II", payload[pos:pos + 8])
+                    track["width"], track["height"] = width >> 16, height >> 16
+            elif box_type == b"hdlr" and track is not None and len(payload) >= 12:
+                track["handler"] = payload[8:12]
+            elif box_type == b"stsd" and track is not None and len(payload) >= 16:
+                track["codec"] = payload[12:16].decode("latin-1").strip()
+
+    walk(0, len(data), None)
+    video = next((t for t in tracks if t.get("handler") == b"vide"), None)
+    if video is not None:
+        info.update({k: video[k] for k in ("width", "height", "codec") if video.get(k) is not None})
+    return info
+
+
+def probe_mp4(path):
+    """
+    Pure-Python fallback: walk the top-level MP4/MOV boxes and read mvhd,
+    tkhd, hdlr and stsd from moov. Also the only source of moov_offset.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(4)
+        if f.read(4) not in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+            raise ProbeError("not an MP4/MOV file")
+        for box_type, offset, header_size, size in _top_level_boxes(f, file_size):
+            if box_type != b"moov":
+                continue
+            if size > MAX_MOOV_BYTES:
+                raise ProbeError(f"moov box too large ({size} bytes)")
+            f.seek(offset + header_size)
+            info = _parse_moov(f.read(size - header_size))
+            info["moov_offset"] = offset
+            if info.get("duration"):
+                info["bitrate"] = int(file_size * 8 / info["duration"])
+            return info
+    raise ProbeError("no moov box (incomplete upload?)")
+
+
+_ffprobe = None
+
+
+def _ffprobe_binary():
+    global _ffprobe
+    if _ffprobe is None:
+        _ffprobe = shutil.which(FFPROBE_PATH) or ""
+    return _ffprobe
+
+
+def probe_ffprobe(path, timeout=MEDIA_PROBE_TIMEOUT):
+    """duration / width / height / bitrate / codec via ffprobe; None when ffprobe is not installed."""
+    binary = _ffprobe_binary()
+    if not binary:
+        return None
+    proc = subprocess.run(
+        [binary, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(path)],
+        capture_output=True,
+        timeout=timeout,
+    )
+    if proc.returncode != 0:
+        raise ProbeError(proc.stderr.decode("utf-8", "replace").strip()[:500] or f"ffprobe exited with {proc.returncode}")
+    out = json.loads(proc.stdout or b"{}")
+    fmt = out.get("format") or {}
+    video = next((s for s in out.get("streams") or [] if s.get("codec_type") == "video"), {})
+    info = {
+        "duration": float(fmt["duration"]) if fmt.get("duration") else None,
+        "bitrate": int(fmt["bit_rate"]) if fmt.get("bit_rate") else None,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "codec": video.get("codec_name"),
+    }
+    return {k: v for k, v in info.items() if v is not None}
+
+
+def probe(path):
+    """
+    Media facts for one file as a dict over PROBE_COLUMNS (missing keys are
+    unknown). ffprobe is preferred; the box parser fills in moov_offset and
+    stands in entirely when ffprobe is missing or fails.
+    """
+    info, ffprobe_error = {}, None
+    try:
+        info = probe_ffprobe(path) or {}
+    except (ProbeError, subprocess.TimeoutExpired, ValueError) as e:
+        ffprobe_error = e
+    try:
+        boxes = probe_mp4(path)
+    except (ProbeError, OSError, struct.error) as e:
+        if not info:
+            raise ProbeError(str(ffprobe_error or e))
+        boxes = {}
+    for key, value in boxes.items():
+        info.setdefault(key, value)
+    return info
+
+
+class MediaProber:
+    """
+    Background workers that fill the probe columns of file_records.
+
+    Rows start with probe_status NULL; a worker claims one (newest first, so
+    fresh uploads never wait behind the backfill of old rows), probes the
+    file outside any transaction and writes the result to every row sharing
+    the same digest. Existing rows are thereby backfilled one at a time.
+    Uploads only call notify(), so probing never delays a request.
+    on_probed(record) runs on the worker after a successful probe.
+    """
+
+    def __init__(self, connect, workers=MEDIA_PROBE_WORKERS, poll_interval=30.0, on_probed=None):
+        self._connect = connect
+        self._on_probed = on_probed
+        self._workers = max(0, int(workers))
+        self._poll_interval = poll_interval
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._dirty = False
+        self._probed = 0
+        self._failed = 0
+
+    def start(self):
+        if self._threads or not self._workers:
+            return
+        self._stopping = False
+        try:
+            with self._connect() as conn:
+                # rows claimed by a process that died are probed again
+                conn.execute("UPDATE file_records SET probe_status = NULL WHERE probe_status = 'probing'")
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️ 素材探测恢复失败: {e}")
+        for i in range(self._workers):
+            t = threading.Thread(target=self._worker_loop, name=f"media-probe-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        print(f"✅ 素材探测已启动，worker 数量: {self._workers}，ffprobe: {_ffprobe_binary() or '未安装，使用内置 MP4 解析'}")
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def notify(self):
+        """Wake idle workers after new file_records rows were committed."""
+        with self._wakeup:
+            self._dirty = True
+            self._wakeup.notify_all()
+
+    def _claim(self):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                "SELECT id, file_path, digest FROM file_records WHERE probe_status IS NULL ORDER BY id DESC LIMIT 1"
+            )
+            row = cur.fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            row = dict(row)
+            cur.execute("UPDATE file_records SET probe_status = 'probing' WHERE id = ?", (row["id"],))
+            if row["digest"]:
+                # the same content was probed before: copy instead of probing again
+                cur.execute(
+                    f"""
+                    SELECT {", ".join(PROBE_COLUMNS)} FROM file_records
+                    WHERE digest = ? AND probe_status = 'done' LIMIT 1
+                    """,
+                    (row["digest"],),
+                )
+                known = cur.fetchone()
+                row["known"] = dict(known) if known is not None else None
+            conn.commit()
+            return row
+
+    def _store(self, row, info, error):
+        status = "failed" if error else "done"
+        values = [info.get(col) for col in PROBE_COLUMNS]
+        with self._connect() as conn:
+            conn.execute(
+                f"""
+                UPDATE file_records
+                SET {", ".join(f"{col} = ?" for col in PROBE_COLUMNS)}, probe_status = ?, probe_error = ?
+                WHERE id = ? OR (digest IS NOT NULL AND digest = ?)
+                """,
+                (*values, status, error, row["id"], row["digest"]),
+            )
+            conn.commit()
+
+    def _probe_row(self, row):
+        if row.get("known"):
+            # same content as an earlier row, whose thumbnails are cached under the same digest
+            self._store(row, row["known"], None)
+            return
+        path = video_dir() / str(row["file_path"])
+        try:
+            info, error = probe(path), None
+        except (ProbeError, OSError) as e:
+            info, error = {}, str(e)
+        self._store(row, info, error)
+        if error:
+            self._failed += 1
+            print(f"⚠️ 素材探测失败 {row['file_path']}: {error}")
+        else:
+            self._probed += 1
+            if self._on_probed is not None:
+                self._on_probed({**row, **info, "probe_status": "done"})
+
+    def _worker_loop(self):
+        while not self._stopping:
+            try:
+                row = self._claim()
+            except Exception as e:
+                print(f"⚠️ 素材探测领取失败: {e}")
+                row = None
+            if row is None:
+                with self._wakeup:
+                    if not self._stopping and not self._dirty:
+                        self._wakeup.wait(self._poll_interval)
+                    self._dirty = False
+                continue
+            try:
+                self._probe_row(row)
+            except Exception as e:
+                print(f"⚠️ 素材探测异常 {row['file_path']}: {e}")
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT COALESCE(probe_status, 'waiting') AS status, COUNT(1) AS n FROM file_records GROUP BY 1"
+            ).fetchall()
+        return {
+            "workers": self._workers,
+            "ffprobe": bool(_ffprobe_binary()),
+            "probed": self._probed,
+            "failed": self._failed,
+            "rows": {r["status"]: int(r["n"]) for r in rows},
+        }
@@ -0,0 +1,300 @@
+"""
+Versioned schema migrations.
+
+Every entry in MIGRATIONS runs exactly once per database, in order, and is
+recorded in the schema_version table. Add new schema changes by appending a
+new version; never edit one that has already shipped.
+
+This module only depends on sqlite3 so db/createTable.py can use it without
+the application config.
+"""
+import datetime as dt
+import sqlite3
+
+
+def _columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return {r[1] for r in cur.fetchall()}
+
+
+def _add_column(cur, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN, skipped when the column already exists."""
+    if column not in _columns(cur, table):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+
+
+def _initial_schema(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type INTEGER NOT NULL,
+            filePath TEXT NOT NULL,  -- 存储文件路径
+            userName TEXT NOT NULL,
+            status INTEGER DEFAULT 0
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS file_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, -- 唯一标识每条记录
+            filename TEXT NOT NULL,               -- 文件名
+            filesize REAL,                        -- 文件大小（单位：MB）
+            upload_time DATETIME DEFAULT CURRENT_TIMESTAMP, -- 上传时间，默认当前时间
+            file_path TEXT                        -- 文件路径
+        )
+        """
+    )
+    # 后台登录用户表
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS app_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_login_at DATETIME
+        )
+        """
+    )
+    # 发布任务表（用于 Data 页统计/日志）
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS publish_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            platform_type INTEGER NOT NULL,
+            title TEXT,
+            tags_json TEXT,
+            enable_timer INTEGER DEFAULT 0,
+            videos_per_day INTEGER DEFAULT 1,
+            daily_times_json TEXT,
+            start_days INTEGER DEFAULT 0,
+            product_link TEXT,
+            product_title TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'created',
+            error_msg TEXT
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS publish_task_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            account_file_path TEXT NOT NULL,
+            scheduled_at DATETIME,
+            started_at DATETIME,
+            finished_at DATETIME,
+            status TEXT DEFAULT 'pending',
+            result_msg TEXT
+        )
+        """
+    )
+
+
+def _publish_task_options(cur):
+    # options the background queue needs to rebuild an upload from the task row
+    _add_column(cur, "publish_tasks", "category", "category INTEGER")
+    _add_column(cur, "publish_tasks", "is_draft", "is_draft INTEGER DEFAULT 0")
+    _add_column(cur, "publish_tasks", "thumbnail_path", "thumbnail_path TEXT")
+
+
+def _query_indexes(cur):
+    # queue claims and task detail pages filter items by status / task_id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publish_task_items_status ON publish_task_items (status, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publish_task_items_task ON publish_task_items (task_id, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publish_tasks_created ON publish_tasks (created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_file_records_upload_time ON file_records (upload_time)")
+
+
+def _publish_item_leases(cur):
+    # lease_owner / lease_expires_at / heartbeat_at: epoch seconds, written by the claiming worker
+    _add_column(cur, "publish_task_items", "lease_owner", "lease_owner TEXT")
+    _add_column(cur, "publish_task_items", "lease_expires_at", "lease_expires_at REAL")
+    _add_column(cur, "publish_task_items", "heartbeat_at", "heartbeat_at REAL")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_publish_task_items_lease ON publish_task_items (status, lease_expires_at)"
+    )
+
+
+def _publish_item_retries(cur):
+    # attempts counts claims; next_attempt_at (epoch seconds) holds a retry back until its backoff ran out
+    _add_column(cur, "publish_task_items", "attempts", "attempts INTEGER DEFAULT 0")
+    _add_column(cur, "publish_task_items", "next_attempt_at", "next_attempt_at REAL")
+
+
+def _publish_batches(cur):
+    # /postVideoBatch groups several publish tasks under one batch id
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS publish_batches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    _add_column(cur, "publish_tasks", "batch_id", "batch_id INTEGER")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publish_tasks_batch ON publish_tasks (batch_id)")
+
+
+def _publish_rate_buckets(cur):
+    # token bucket per "<platform_type>:<account_file_path>"; updated_at is epoch seconds of the last take
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS publish_rate_buckets (
+            bucket TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def _publish_circuit_breakers(cur):
+    # breaker key is "<platform_type>" or "<platform_type>:<account_file_path>";
+    # recent holds the last outcomes as '1' (success) / '0' (failure), oldest first
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS publish_circuit_breakers (
+            breaker TEXT PRIMARY KEY,
+            state TEXT NOT NULL DEFAULT 'closed',
+            recent TEXT NOT NULL DEFAULT '',
+            opened_at REAL,
+            probe_item_id INTEGER,
+            updated_at REAL
+        )
+        """
+    )
+
+
+def _publish_task_pause(cur):
+    # paused tasks keep their items but the queue does not claim them until resumed
+    _add_column(cur, "publish_tasks", "paused", "paused INTEGER DEFAULT 0")
+
+
+def _publish_task_priority(cur):
+    # higher priority is dispatched first; started_at backs the fair-share usage window
+    _add_column(cur, "publish_tasks", "priority", "priority INTEGER DEFAULT 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_publish_task_items_started ON publish_task_items (started_at)")
+
+
+def _upload_sessions(cur):
+    # resumable chunked uploads; file_records is only written once every chunk arrived
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            total_chunks INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            upload_id TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            PRIMARY KEY (upload_id, chunk_index)
+        )
+        """
+    )
+
+
+def _material_blobs(cur):
+    # content-addressed materials: one file per digest, file_records rows are references to it;
+    # rows uploaded before this migration keep digest NULL and own their file
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS material_blobs (
+            digest TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL
+        )
+        """
+    )
+    _add_column(cur, "file_records", "digest", "digest TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_file_records_digest ON file_records (digest)")
+
+
+def _media_probe(cur):
+    # filled in the background by myUtils.mediaProbe; probe_status NULL = not probed yet (backfill included)
+    _add_column(cur, "file_records", "duration", "duration REAL")
+    _add_column(cur, "file_records", "width", "width INTEGER")
+    _add_column(cur, "file_records", "height", "height INTEGER")
+    _add_column(cur, "file_records", "bitrate", "bitrate INTEGER")
+    _add_column(cur, "file_records", "codec", "codec TEXT")
+    _add_column(cur, "file_records", "moov_offset", "moov_offset INTEGER")
+    _add_column(cur, "file_records", "probe_status", "probe_status TEXT")
+    _add_column(cur, "file_records", "probe_error", "probe_error TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_file_records_probe_status ON file_records (probe_status)")
+
+
+# (version, description, callable(cursor))
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "publish task upload options", _publish_task_options),
+    (3, "query indexes", _query_indexes),
+    (4, "publish item leases", _publish_item_leases),
+    (5, "publish item retries", _publish_item_retries),
+    (6, "publish batches", _publish_batches),
+    (7, "publish rate buckets", _publish_rate_buckets),
+    (8, "publish circuit breakers", _publish_circuit_breakers),
+    (9, "publish task pause", _publish_task_pause),
+    (10, "publish task priority", _publish_task_priority),
+    (11, "upload sessions", _upload_sessions),
+    (12, "material blobs", _material_blobs),
+    (13, "media probe columns", _media_probe),
+]
+
+
+def current_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return int(row[0] or 0)
+
+
+def migrate(conn):
+    """Bring the database up to the latest version; returns the list of versions applied."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+        """
+    )
+    conn.commit()
+
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        cur = conn.cursor()
+        # the write lock serialises concurrent starters (API + worker processes)
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= current_version(conn):
+                conn.rollback()
+                continue
+            apply(cur)
+            cur.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
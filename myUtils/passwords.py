@@ -0,0 +1,99 @@
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import conf
+
+# PBKDF2 迭代次数；修改后，用户下次登录时会自动按新成本重新哈希
+PASSWORD_HASH_ITERATIONS = getattr(conf, "PASSWORD_HASH_ITERATIONS", 200_000)
+# 哈希进程数与同时排队的哈希请求上限（超过则直接返回 503）
+PASSWORD_HASH_WORKERS = getattr(conf, "PASSWORD_HASH_WORKERS", 2)
+PASSWORD_HASH_MAX_PENDING = getattr(conf, "PASSWORD_HASH_MAX_PENDING", 16)
+
+ALGORITHM = "pbkdf2_sha256"
+
+
+def hash_password(password: str, *, iterations: int = PASSWORD_HASH_ITERATIONS) -> str:
+    salt = secrets.token_bytes(16)
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "{}${}${}${}".format(
+        ALGORITHM,
+        iterations,
+        base64.b64encode(salt).decode("utf-8"),
+        base64.b64encode(dk).decode("utf-8"),
+    )
+
+
+def verify_password(password: str, stored: str) -> bool:
+    try:
+        algo, iters_s, salt_b64, dk_b64 = stored.split("$", 3)
+        if algo != ALGORITHM:
+            return False
+        iters = int(iters_s)
+        salt = base64.b64decode(salt_b64.encode("utf-8"))
+        dk_expected = base64.b64decode(dk_b64.encode("utf-8"))
+        dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iters)
+        return hmac.compare_digest(dk, dk_expected)
+    except Exception:
+        return False
+
+
+def needs_rehash(stored: str, *, iterations: int = PASSWORD_HASH_ITERATIONS) -> bool:
+    """True when stored was produced with a different algorithm or cost than configured."""
+    try:
+        algo, iters_s, _ = stored.split("$", 2)
+        return algo != ALGORITHM or int(iters_s) != int(iterations)
+    except ValueError:
+        return True
+
+
+class HasherBusy(Exception):
+    """Raised when too many hash / verify calls are already queued."""
+
+
+class PasswordHasher:
+    """
+    Runs PBKDF2 in a small process pool so a burst of logins cannot stall the
+    Flask request threads. At most max_pending calls may wait for the pool at
+    once; anything beyond that is rejected with HasherBusy right away.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING, iterations=PASSWORD_HASH_ITERATIONS):
+        self.workers = max(1, int(workers))
+        self.iterations = int(iterations)
+        self._slots = threading.BoundedSemaphore(max(1, int(max_pending)))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _call(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("too many concurrent password operations")
+        try:
+            return self._pool().submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        return self._call(hash_password, password, iterations=self.iterations)
+
+    def verify(self, password: str, stored: str) -> bool:
+        return self._call(verify_password, password, stored)
+
+    def needs_rehash(self, stored: str) -> bool:
+        return needs_rehash(stored, iterations=self.iterations)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,115 @@
+import asyncio
+import os
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from myUtils.asyncRuntime import runtime as async_runtime
+from myUtils.auth import check_cookie
+from myUtils.resourceGovernor import resource_governor
+
+# /postVideo 默认是否做发布前预检（请求体中的 preflight 字段优先）
+PREFLIGHT_ENABLED = getattr(conf, "PREFLIGHT_ENABLED", False)
+# 发布前预检：同时进行的 cookie 校验数（每次校验会启动浏览器）与单次校验超时（秒）
+PREFLIGHT_CONCURRENCY = getattr(conf, "PREFLIGHT_CONCURRENCY", 4)
+PREFLIGHT_COOKIE_TIMEOUT = getattr(conf, "PREFLIGHT_COOKIE_TIMEOUT", 60)
+# 视频文件大小上限（MB）：key 为平台 type，"default" 为兜底，0 表示不限
+PREFLIGHT_MAX_FILE_MB = getattr(conf, "PREFLIGHT_MAX_FILE_MB", {})
+
+
+def _max_file_mb(platform_type):
+    limits = PREFLIGHT_MAX_FILE_MB
+    return float(limits.get(platform_type, limits.get(str(platform_type), limits.get("default", 0))) or 0)
+
+
+def check_file(platform_type, file_path):
+    """Returns (size_mb, error); error is None when the file can be published."""
+    base = Path(BASE_DIR / "videoFile").resolve()
+    path = Path(base / str(file_path)).resolve()
+    if not path.is_relative_to(base):
+        return None, "非法文件路径"
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None, "视频文件不存在"
+    except OSError as e:
+        return None, f"无法读取视频文件: {e}"
+    size_mb = st.st_size / (1024 * 1024)
+    if st.st_size == 0:
+        return 0.0, "视频文件为空"
+    max_mb = _max_file_mb(platform_type)
+    if max_mb and size_mb > max_mb:
+        return round(size_mb, 2), f"视频文件超过 {max_mb:g}MB 上限"
+    return round(size_mb, 2), None
+
+
+async def _governed_check(platform_type, account_file_path):
+    # check_cookie launches a browser, so it waits for room like uploads and logins do
+    await resource_governor.acquire_async("preflight")
+    try:
+        return await check_cookie(platform_type, account_file_path)
+    finally:
+        resource_governor.release("preflight")
+
+
+async def _check_account(platform_type, account_file_path, semaphore, timeout):
+    base = Path(BASE_DIR / "cookiesFile").resolve()
+    cookie = Path(base / str(account_file_path)).resolve()
+    if not cookie.is_relative_to(base):
+        return "非法账号路径"
+    if not cookie.exists():
+        return "cookie 文件不存在"
+    async with semaphore:
+        try:
+            valid = await asyncio.wait_for(_governed_check(platform_type, str(account_file_path)), timeout)
+        except asyncio.TimeoutError:
+            return "cookie 校验超时"
+        except Exception as e:
+            return f"cookie 校验失败: {e}"
+    return None if valid else "cookie 已失效，请重新登录"
+
+
+async def preflight_async(platform_type, file_list, account_list, concurrency=PREFLIGHT_CONCURRENCY, timeout=PREFLIGHT_COOKIE_TIMEOUT):
+    loop = asyncio.get_running_loop()
+    files = list(dict.fromkeys(str(f) for f in file_list))
+    accounts = list(dict.fromkeys(str(a) for a in account_list))
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+    # every distinct file and account is checked once, all of them concurrently
+    results = await asyncio.gather(
+        *(loop.run_in_executor(None, check_file, platform_type, f) for f in files),
+        *(_check_account(platform_type, a, semaphore, timeout) for a in accounts),
+    )
+    return dict(zip(files, results[:len(files)])), dict(zip(accounts, results[len(files):]))
+
+
+def preflight(platform_type, file_list, account_list):
+    """
+    Check every (file, account) pair before a publish task is created.
+
+    Files are checked for existence and size, accounts with check_cookie;
+    each distinct file / account is only checked once. Returns a report:
+    {"ok": bool, "valid": n, "invalid": n, "items": [{file_path,
+    account_file_path, ok, size_mb, errors}, ...]}.
+    """
+    files, accounts = async_runtime.run(preflight_async(platform_type, file_list, account_list))
+    items = []
+    for file_path in file_list:
+        size_mb, file_error = files[str(file_path)]
+        for account_file_path in account_list:
+            errors = [e for e in (file_error, accounts[str(account_file_path)]) if e]
+            items.append(
+                {
+                    "file_path": str(file_path),
+                    "account_file_path": str(account_file_path),
+                    "ok": not errors,
+                    "size_mb": size_mb,
+                    "errors": errors,
+                }
+            )
+    invalid = sum(1 for item in items if not item["ok"])
+    return {"ok": invalid == 0, "valid": len(items) - invalid, "invalid": invalid, "items": items}
+
+
+def invalid_pairs(report):
+    return {(item["file_path"], item["account_file_path"]) for item in report["items"] if not item["ok"]}
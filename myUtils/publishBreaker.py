@@ -0,0 +1,182 @@
+import time
+
+import conf
+
+# 熔断策略：key 为平台 type，"default" 为兜底
+# 最近 window 次结果中失败率 >= failure_rate（且至少 min_calls 次）时熔断，
+# 该平台（per_account=True 时为该账号）剩余的待发布条目转为 deferred；
+# open_seconds 后放行一次试探发布，成功则恢复，失败则继续熔断
+PUBLISH_CIRCUIT_BREAKER = getattr(conf, "PUBLISH_CIRCUIT_BREAKER", {})
+
+DEFAULT_BREAKER = {"window": 10, "min_calls": 5, "failure_rate": 0.6, "open_seconds": 900, "per_account": False}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class BreakerPolicy:
+    def __init__(self, window=10, min_calls=5, failure_rate=0.6, open_seconds=900, per_account=False):
+        self.window = max(1, int(window))
+        self.min_calls = min(max(1, int(min_calls)), self.window)
+        self.failure_rate = min(max(float(failure_rate), 0.0), 1.0)
+        self.open_seconds = max(0.0, float(open_seconds))
+        self.per_account = bool(per_account)
+
+    def should_trip(self, recent):
+        """recent: outcome string, '1' = success, '0' = failure, oldest first."""
+        if len(recent) < self.min_calls:
+            return False
+        return recent.count("0") / len(recent) >= self.failure_rate
+
+
+def breaker_policy_for(platform_type, policies=None):
+    policies = PUBLISH_CIRCUIT_BREAKER if policies is None else policies
+    options = dict(DEFAULT_BREAKER)
+    options.update(policies.get("default", {}))
+    options.update(policies.get(platform_type, policies.get(str(platform_type), {})))
+    return BreakerPolicy(**options)
+
+
+class PublishBreaker:
+    """
+    Circuit breaker per platform_type (or per platform + account).
+
+    State is stored in publish_circuit_breakers so every worker process
+    honours it. Outcomes are kept as a short '1'/'0' string per breaker; when
+    the failure rate over that window crosses the threshold the breaker
+    opens and the key's pending items are parked as 'deferred'. Once
+    open_seconds passed, one deferred item is released as the half-open
+    probe: success closes the breaker and releases the rest, failure opens
+    it again.
+
+    All methods work on the caller's cursor and expect to run inside a
+    BEGIN IMMEDIATE transaction.
+    """
+
+    def __init__(self, policies=None):
+        self._policies = policies
+
+    def policy_for(self, platform_type):
+        return breaker_policy_for(platform_type, self._policies)
+
+    def key_for(self, platform_type, account):
+        if self.policy_for(platform_type).per_account:
+            return f"{int(platform_type)}:{account}"
+        return str(int(platform_type))
+
+    @staticmethod
+    def _scope(key):
+        """(platform_type, account or None) for a breaker key."""
+        platform, _, account = key.partition(":")
+        return int(platform), account or None
+
+    def _set_items(self, cur, key, from_status, to_status, limit=None):
+        platform_type, account = self._scope(key)
+        sql = """
+            UPDATE publish_task_items SET status = ?
+            WHERE id IN (
+              SELECT i.id FROM publish_task_items i
+              JOIN publish_tasks t ON t.id = i.task_id
+              WHERE i.status = ? AND t.platform_type = ?
+        """
+        params = [to_status, from_status, platform_type]
+        if account is not None:
+            sql += " AND i.account_file_path = ?"
+            params.append(account)
+        sql += " ORDER BY i.id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        sql += ")"
+        cur.execute(sql, params)
+        return cur.rowcount
+
+    def blocked(self, cur, now=None):
+        """
+        Called at the start of every claim.
+
+        Moves breakers whose open period ran out to half-open (releasing one
+        deferred item as the probe) and returns {key: (state, probe_item_id)}
+        for every breaker that is not closed.
+        """
+        now = time.time() if now is None else now
+        cur.execute("SELECT breaker, state, opened_at, probe_item_id FROM publish_circuit_breakers WHERE state != ?", (CLOSED,))
+        states = {}
+        for r in cur.fetchall():
+            key, state, probe = r["breaker"], r["state"], r["probe_item_id"]
+            opened_at = float(r["opened_at"] or 0)
+            policy = self.policy_for(self._scope(key)[0])
+            if state == HALF_OPEN and probe is not None:
+                cur.execute("SELECT status FROM publish_task_items WHERE id = ?", (probe,))
+                probe_row = cur.fetchone()
+                if probe_row is None or probe_row["status"] not in ("pending", "running"):
+                    # the probe went away without an outcome (deleted, cancelled): pick another one
+                    state, probe, opened_at = OPEN, None, 0.0
+            if state == OPEN and opened_at + policy.open_seconds <= now:
+                state, probe = HALF_OPEN, None
+                cur.execute(
+                    "UPDATE publish_circuit_breakers SET state = ?, probe_item_id = NULL WHERE breaker = ?",
+                    (HALF_OPEN, key),
+                )
+                self._set_items(cur, key, "deferred", "pending", limit=1)
+            states[key] = (state, probe)
+        return states
+
+    def admit(self, cur, states, item):
+        """
+        Whether a claim candidate may run given the blocked() snapshot.
+
+        The first item claimed for a half-open breaker becomes its probe;
+        everything else behind an open or probing breaker is parked.
+        """
+        key = self.key_for(item["platform_type"], item["account_file_path"])
+        if key not in states:
+            return True
+        state, probe = states[key]
+        if state == HALF_OPEN and probe in (None, item["id"]):
+            cur.execute("UPDATE publish_circuit_breakers SET probe_item_id = ? WHERE breaker = ?", (item["id"], key))
+            states[key] = (HALF_OPEN, item["id"])
+            return True
+        cur.execute("UPDATE publish_task_items SET status = 'deferred' WHERE id = ? AND status = 'pending'", (item["id"],))
+        return False
+
+    def record(self, cur, platform_type, account, item_id, success, now=None):
+        """Record one upload outcome; returns the breaker state afterwards."""
+        now = time.time() if now is None else now
+        policy = self.policy_for(platform_type)
+        key = self.key_for(platform_type, account)
+        cur.execute("SELECT state, recent, probe_item_id FROM publish_circuit_breakers WHERE breaker = ?", (key,))
+        row = cur.fetchone()
+        state = row["state"] if row else CLOSED
+        recent = ((row["recent"] if row else "") + ("1" if success else "0"))[-policy.window:]
+        opened_at = None
+        probe = row["probe_item_id"] if row else None
+
+        if state == HALF_OPEN and probe == item_id:
+            if success:
+                state, recent, probe = CLOSED, "", None
+                self._set_items(cur, key, "deferred", "pending")
+            else:
+                state, opened_at, probe = OPEN, now, None
+        elif state == CLOSED and not success and policy.should_trip(recent):
+            state, opened_at = OPEN, now
+            self._set_items(cur, key, "pending", "deferred")
+
+        cur.execute(
+            """
+            INSERT INTO publish_circuit_breakers (breaker, state, recent, opened_at, probe_item_id, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(breaker) DO UPDATE SET
+              state = excluded.state, recent = excluded.recent,
+              opened_at = COALESCE(excluded.opened_at, publish_circuit_breakers.opened_at),
+              probe_item_id = excluded.probe_item_id, updated_at = excluded.updated_at
+            """,
+            (key, state, recent, opened_at, probe, now),
+        )
+        return state
+
+    def snapshot(self, cur):
+        cur.execute("SELECT breaker, state, recent, opened_at, probe_item_id FROM publish_circuit_breakers ORDER BY breaker")
+        return {r["breaker"]: {k: r[k] for k in ("state", "recent", "opened_at", "probe_item_id")} for r in cur.fetchall()}
+
+
+publish_breaker = PublishBreaker()
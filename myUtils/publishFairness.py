@@ -0,0 +1,156 @@
+import datetime as dt
+import time
+from collections import defaultdict
+
+import conf
+from myUtils.publishScheduler import scheduled_epoch
+
+# 公平调度：按 user_id 加权轮转（key 为 user_id，未配置的用户权重为 1）
+PUBLISH_USER_WEIGHTS = getattr(conf, "PUBLISH_USER_WEIGHTS", {})
+# 计算各用户"已占用份额"时回看的时间窗口（秒）：窗口内开始的上传与正在进行的上传都计入
+PUBLISH_FAIR_WINDOW_SECONDS = getattr(conf, "PUBLISH_FAIR_WINDOW_SECONDS", 3600)
+# 同一用户的多个任务之间是否也轮转（否则同一用户内按提交顺序）
+PUBLISH_FAIR_ACROSS_TASKS = getattr(conf, "PUBLISH_FAIR_ACROSS_TASKS", False)
+# 估算开始时间时参考的最近完成条目数
+ESTIMATE_SAMPLE_SIZE = 50
+
+
+def _iso(epoch):
+    return dt.datetime.utcfromtimestamp(epoch).replace(microsecond=0).isoformat() + "Z"
+
+
+class FairOrder:
+    """
+    Weighted-fair ordering of waiting publish items.
+
+    Higher publish_tasks.priority always goes first. Within a priority, every
+    user's k-th waiting item gets the virtual time (served + k) / weight,
+    where served counts the user's running uploads plus those started within
+    the window, and items run in virtual-time order. A single urgent post of
+    a quiet user therefore overtakes a 300-item backlog of a busy one. With
+    across_tasks the same is applied between the tasks of one user.
+
+    The queue uses rank() to order claim candidates; queue_position() runs
+    the same ordering over every waiting item for the task detail API.
+    """
+
+    def __init__(self, weights=None, window=PUBLISH_FAIR_WINDOW_SECONDS, across_tasks=PUBLISH_FAIR_ACROSS_TASKS):
+        self.weights = {str(k): max(0.01, float(v)) for k, v in (PUBLISH_USER_WEIGHTS if weights is None else weights).items()}
+        self.window = max(0, int(window))
+        self.across_tasks = bool(across_tasks)
+
+    def weight(self, user_id):
+        return self.weights.get(str(user_id), 1.0)
+
+    def usage(self, cur, now=None):
+        """({user_id: served}, {task_id: served}) over the fairness window."""
+        now = time.time() if now is None else now
+        cur.execute(
+            """
+            SELECT t.user_id, i.task_id, COUNT(1) AS served
+            FROM publish_task_items i
+            JOIN publish_tasks t ON t.id = i.task_id
+            WHERE i.status = 'running' OR i.started_at >= ?
+            GROUP BY t.user_id, i.task_id
+            """,
+            (_iso(now - self.window),),
+        )
+        by_user, by_task = defaultdict(int), defaultdict(int)
+        for r in cur.fetchall():
+            by_user[r["user_id"]] += int(r["served"])
+            by_task[r["task_id"]] += int(r["served"])
+        return by_user, by_task
+
+    def rank(self, rows, usage):
+        """
+        Sort rows (needing id, task_id, user_id, priority) into dispatch order.
+        Returns [(row, virtual_time), ...].
+        """
+        by_user, by_task = usage
+        per_user = defaultdict(list)
+        for row in rows:
+            per_user[row["user_id"]].append(row)
+
+        ranked = []
+        for user_id, user_rows in per_user.items():
+            task_k = defaultdict(int)
+            keyed = []
+            for row in sorted(user_rows, key=lambda r: r["id"]):
+                task_vt = 0
+                if self.across_tasks:
+                    task_vt = by_task[row["task_id"]] + task_k[row["task_id"]]
+                    task_k[row["task_id"]] += 1
+                keyed.append((-int(row["priority"] or 0), task_vt, row["id"], row))
+            keyed.sort(key=lambda k: k[:3])
+            weight = self.weight(user_id)
+            for k, (_, _, _, row) in enumerate(keyed):
+                ranked.append((row, (by_user[user_id] + k) / weight))
+
+        ranked.sort(key=lambda rv: (-int(rv[0]["priority"] or 0), rv[1], rv[0]["id"]))
+        return ranked
+
+    def queue_position(self, cur, task_id, concurrency, now=None):
+        """
+        Where the task's next waiting item stands in the queue.
+
+        Returns {"position", "waiting", "avg_item_seconds", "estimated_start_at"};
+        position is the number of items that will be dispatched before it
+        (0 while the task has an upload running). The estimate assumes
+        `concurrency` uploads run in parallel at the recent average duration.
+        """
+        now = time.time() if now is None else now
+        cur.execute(
+            """
+            SELECT i.id, i.task_id, i.status, i.scheduled_at, t.user_id, t.priority
+            FROM publish_task_items i
+            JOIN publish_tasks t ON t.id = i.task_id
+            WHERE i.status IN ('pending', 'running', 'scheduled') AND COALESCE(t.paused, 0) = 0
+            """
+        )
+        rows = cur.fetchall()
+        own = [r for r in rows if r["task_id"] == task_id]
+        waiting = [r for r in rows if r["status"] == "pending"]
+        own_waiting = [r for r in own if r["status"] == "pending"]
+
+        cur.execute(
+            """
+            SELECT AVG((julianday(finished_at) - julianday(started_at)) * 86400.0) FROM (
+              SELECT started_at, finished_at FROM publish_task_items
+              WHERE status = 'success' AND started_at IS NOT NULL AND finished_at IS NOT NULL
+              ORDER BY id DESC LIMIT ?
+            )
+            """,
+            (ESTIMATE_SAMPLE_SIZE,),
+        )
+        avg = cur.fetchone()[0]
+        avg = float(avg) if avg else None
+        result = {
+            "position": None,
+            "waiting": len(own_waiting),
+            "avg_item_seconds": round(avg, 1) if avg else None,
+            "estimated_start_at": None,
+        }
+
+        if any(r["status"] == "running" for r in own):
+            result["position"] = 0
+            result["estimated_start_at"] = _iso(now)
+        elif own_waiting:
+            ranked = self.rank(waiting, self.usage(cur, now))
+            position = next(i for i, (row, _) in enumerate(ranked) if row["task_id"] == task_id)
+            result["position"] = position
+            if avg:
+                running = sum(1 for r in rows if r["status"] == "running")
+                slots = max(1, int(concurrency))
+                # items ahead plus the uploads in flight drain `slots` at a time
+                rounds = (position + running) // slots
+                result["estimated_start_at"] = _iso(now + rounds * avg)
+        elif own:
+            # only scheduled items left: they start when they fall due
+            due = [scheduled_epoch(r["scheduled_at"]) for r in own]
+            due = [d for d in due if d is not None]
+            if due:
+                result["estimated_start_at"] = _iso(max(now, min(due)))
+        return result
+
+
+fair_order = FairOrder()
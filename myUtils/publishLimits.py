@@ -0,0 +1,74 @@
+import threading
+from collections import defaultdict
+
+import conf
+
+# 全局同时上传数 / 单平台同时上传数 / 单账号同时上传数
+PUBLISH_MAX_CONCURRENCY = getattr(conf, "PUBLISH_MAX_CONCURRENCY", 4)
+PUBLISH_PLATFORM_CONCURRENCY = getattr(conf, "PUBLISH_PLATFORM_CONCURRENCY", {})
+PUBLISH_ACCOUNT_CONCURRENCY = getattr(conf, "PUBLISH_ACCOUNT_CONCURRENCY", 1)
+
+
+class ConcurrencyLimiter:
+    """
+    Three-level upload slot accounting: global, per platform_type and per account.
+
+    All three counters are checked and taken under one lock, so a caller either
+    gets every level or none of them (no partial holds, no lock-ordering issues).
+    """
+
+    def __init__(self, global_limit=4, platform_limits=None, account_limit=1):
+        self.global_limit = max(1, int(global_limit))
+        self.platform_limits = {int(k): max(1, int(v)) for k, v in (platform_limits or {}).items()}
+        self.account_limit = max(1, int(account_limit))
+        self._cond = threading.Condition()
+        self._total = 0
+        self._by_platform = defaultdict(int)
+        self._by_account = defaultdict(int)
+
+    def _platform_limit(self, platform_type):
+        return self.platform_limits.get(int(platform_type), self.global_limit)
+
+    def _has_room(self, platform_type, account):
+        return (
+            self._total < self.global_limit
+            and self._by_platform[int(platform_type)] < self._platform_limit(platform_type)
+            and self._by_account[str(account)] < self.account_limit
+        )
+
+    def _take(self, platform_type, account):
+        self._total += 1
+        self._by_platform[int(platform_type)] += 1
+        self._by_account[str(account)] += 1
+
+    def try_acquire(self, platform_type, account):
+        with self._cond:
+            if not self._has_room(platform_type, account):
+                return False
+            self._take(platform_type, account)
+            return True
+
+    def release(self, platform_type, account):
+        with self._cond:
+            self._total -= 1
+            self._by_platform[int(platform_type)] -= 1
+            self._by_account[str(account)] -= 1
+            if self._by_account[str(account)] <= 0:
+                del self._by_account[str(account)]
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "total": self._total,
+                "global_limit": self.global_limit,
+                "by_platform": dict(self._by_platform),
+                "accounts_busy": len(self._by_account),
+            }
+
+
+# shared by every publish worker thread in this process
+publish_limiter = ConcurrencyLimiter(
+    PUBLISH_MAX_CONCURRENCY,
+    PUBLISH_PLATFORM_CONCURRENCY,
+    PUBLISH_ACCOUNT_CONCURRENCY,
+)
@@ -0,0 +1,512 @@
+import datetime as dt
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeout
+
+import conf
+from myUtils.browserPool import browser_pool
+from myUtils.postVideo import build_uploader
+from myUtils.publishBreaker import OPEN, publish_breaker
+from myUtils.publishFairness import fair_order
+from myUtils.publishLimits import publish_limiter
+from myUtils.publishRateLimit import publish_rate_limiter
+from myUtils.publishRetry import policy_for
+from myUtils.resourceGovernor import resource_governor
+from myUtils.statusWriter import StatusWriter
+
+
+# item statuses a worker may pick up; 'scheduled' items are released by ScheduleDispatcher when due,
+# 'deferred' items by the circuit breaker once their platform recovers
+CLAIMABLE_STATUSES = ("pending",)
+# item statuses that keep a task open
+OPEN_STATUSES = ("pending", "scheduled", "deferred", "running")
+# how many candidates to look at when the first ones are blocked by concurrency limits
+CLAIM_SCAN_LIMIT = 50
+# how many items per (platform, account, user, task) lane are considered in one scan
+CLAIM_LANE_DEPTH = 2
+
+# how often a worker checks whether its in-flight item was cancelled (seconds)
+CANCEL_POLL_SECONDS = 2.0
+# result_msg of an item whose cancel arrived after the upload had reached the platform's publish step
+CANCEL_TOO_LATE_MSG = "cancel requested while publishing; the video was published"
+
+# 领取后的租约时长（秒）；worker 会定期续约，进程崩溃后租约过期的条目会被重新排队
+PUBLISH_LEASE_SECONDS = getattr(conf, "PUBLISH_LEASE_SECONDS", 120)
+
+
+def _now_iso():
+    return dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+def recover_expired_leases(conn, now=None):
+    """
+    Requeue items whose worker stopped heart-beating (crash, kill, power loss).
+
+    Items that already finished are never touched, so a restart only re-runs
+    what was actually in flight. Returns the number of items requeued.
+    """
+    now = time.time() if now is None else now
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, task_id FROM publish_task_items
+        WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+        """,
+        (now,),
+    )
+    rows = cur.fetchall()
+    for r in rows:
+        cur.execute(
+            """
+            UPDATE publish_task_items
+            SET status = 'pending', lease_owner = NULL, lease_expires_at = NULL, heartbeat_at = NULL,
+                result_msg = ?
+            WHERE id = ? AND status = 'running'
+            """,
+            ("requeued: worker lease expired", r["id"]),
+        )
+    # tasks left 'running' although every item already reached a final state
+    cur.execute(
+        f"""
+        SELECT t.id FROM publish_tasks t
+        WHERE t.status = 'running' AND NOT EXISTS (
+          SELECT 1 FROM publish_task_items i
+          WHERE i.task_id = t.id AND i.status IN ({",".join("?" * len(OPEN_STATUSES))})
+        )
+        """,
+        OPEN_STATUSES,
+    )
+    for r in cur.fetchall():
+        refresh_task_status(conn, r["id"])
+    # cancelled while running in a process that died: the lease no longer stands for a live upload
+    cur.execute(
+        """
+        UPDATE publish_task_items SET lease_owner = NULL, lease_expires_at = NULL, heartbeat_at = NULL
+        WHERE status = 'cancelled' AND lease_owner IS NOT NULL AND lease_expires_at < ?
+        """,
+        (now,),
+    )
+    return len(rows)
+
+
+def refresh_tasks(conn, task_ids):
+    for task_id in task_ids:
+        refresh_task_status(conn, task_id)
+
+
+class UploadCancelled(Exception):
+    """The item was cancelled through the API while its upload was running."""
+
+
+def refresh_task_status(conn, task_id):
+    """Derive publish_tasks.status from its items once none of them is left to run."""
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT
+          SUM(CASE WHEN status IN ({",".join("?" * len(OPEN_STATUSES))}) THEN 1 ELSE 0 END) AS open_cnt,
+          SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) AS failed_cnt,
+          SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END) AS cancelled_cnt
+        FROM publish_task_items
+        WHERE task_id = ?
+        """,
+        (*OPEN_STATUSES, task_id),
+    )
+    r = cur.fetchone()
+    if int(r["open_cnt"] or 0) > 0:
+        return
+    if int(r["failed_cnt"] or 0) > 0:
+        final_status = "failed"
+    elif int(r["cancelled_cnt"] or 0) > 0:
+        final_status = "cancelled"
+    else:
+        final_status = "success"
+    cur.execute("UPDATE publish_tasks SET status = ? WHERE id = ?", (final_status, task_id))
+
+
+class PublishQueue:
+    """
+    Durable publish queue backed by publish_tasks / publish_task_items.
+
+    The HTTP layer only inserts rows and calls notify(); worker threads claim
+    claimable items one at a time, run the upload and write the outcome back.
+    Items survive a restart because the table itself is the queue.
+
+    A worker only claims an item whose account / platform still has a free
+    slot in the limiter, so busy accounts never hold a worker hostage.
+    The database-backed rate limiter adds per-account upload tokens and
+    per-platform session caps shared by all worker processes; an account
+    that is out of tokens has its pending items pushed back to the time
+    its next token arrives instead of failing them.
+
+    Outcomes feed a circuit breaker per platform (or account): while it is
+    open the key's items are parked as 'deferred' and only a single probe
+    runs once the open period is over.
+
+    Candidates are dispatched by task priority, then weighted-fair across
+    users (see FairOrder). Nothing is claimed while the resource governor
+    has no room for another browser session; the items just stay queued.
+
+    Items of a paused task are not claimed. Cancelling a task flips its
+    running items to 'cancelled' but leaves their lease in place, so the
+    upload still counts against the platform's session cap until the worker
+    finishes it. The worker notices the cancel while it waits for the upload
+    and cancels the coroutine, which closes its browser context, unless the
+    uploader reports it has reached the platform's publish step.
+
+    Claims are leases: the row records the owner and an expiry that a
+    heartbeat thread keeps pushing forward while the upload runs. The same
+    thread periodically requeues leases that expired, which is how items of
+    a crashed process get picked up again.
+
+    Claims are written synchronously (they must be atomic); results, retries
+    and heartbeats go through the write-behind StatusWriter in batches. An
+    item's lease keeps being renewed until its result is committed, so a
+    result that is slow to write never lets the item be claimed again.
+    """
+
+    def __init__(
+        self,
+        connect,
+        workers=1,
+        poll_interval=5.0,
+        limiter=publish_limiter,
+        lease_seconds=PUBLISH_LEASE_SECONDS,
+        writer=None,
+        rate_limiter=publish_rate_limiter,
+        breaker=publish_breaker,
+        fairness=fair_order,
+        governor=resource_governor,
+    ):
+        self._connect = connect
+        self.writer = writer or StatusWriter(connect, on_batch=refresh_tasks)
+        self._limiter = limiter
+        self._rate_limiter = rate_limiter
+        self._breaker = breaker
+        self._fairness = fairness
+        self._governor = governor
+        self._workers = max(1, int(workers))
+        self._poll_interval = poll_interval
+        self._lease_seconds = max(10, int(lease_seconds))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._stopping = False
+        self._dirty = False
+        self._inflight = {}  # item_id -> item
+        self._inflight_lock = threading.Lock()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping = False
+        self._stop_event.clear()
+        try:
+            self.recover()
+        except Exception as e:
+            print(f"⚠️ 发布队列恢复失败: {e}")
+        for i in range(self._workers):
+            t = threading.Thread(target=self._worker_loop, name=f"publish-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        self.writer.start()
+        t = threading.Thread(target=self._lease_loop, name="publish-lease", daemon=True)
+        t.start()
+        self._threads.append(t)
+        print(f"✅ 发布队列已启动，worker 数量: {self._workers}，owner: {self.owner}")
+
+    def recover(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            requeued = recover_expired_leases(conn)
+            conn.commit()
+        if requeued:
+            print(f"♻️ 已重新排队 {requeued} 个租约过期的发布条目")
+            self.notify()
+        return requeued
+
+    def stop(self):
+        """Stop claiming; uploads already running finish on their own."""
+        self._stop_event.set()
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def join(self, timeout=None):
+        """Wait for the threads after stop(), then flush pending status writes."""
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.writer.stop()
+
+    def notify(self):
+        """Wake idle workers after new items were committed."""
+        with self._wakeup:
+            self._dirty = True
+            self._wakeup.notify_all()
+
+    def _claim(self):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            # take the write lock up front so two workers can never claim the same row
+            cur.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            # may release a deferred item as the half-open probe, so it runs before the scan
+            breakers = self._breaker.blocked(cur, now)
+            # only the head items of each (platform, account, user, task) lane are candidates,
+            # so a long task cannot hide other platforms', users' or tasks' items from the scan
+            cur.execute(
+                f"""
+                SELECT * FROM (
+                  SELECT i.id, i.task_id, i.file_path, i.account_file_path, i.scheduled_at, i.attempts,
+                         t.platform_type, t.title, t.tags_json, t.category, t.is_draft,
+                         t.thumbnail_path, t.product_link, t.product_title, t.user_id,
+                         COALESCE(t.priority, 0) AS priority,
+                         ROW_NUMBER() OVER (
+                           PARTITION BY t.platform_type, i.account_file_path, t.user_id, i.task_id ORDER BY i.id
+                         ) AS lane_pos
+                  FROM publish_task_items i
+                  JOIN publish_tasks t ON t.id = i.task_id
+                  WHERE i.status IN ({",".join("?" * len(CLAIMABLE_STATUSES))})
+                    AND (i.next_attempt_at IS NULL OR i.next_attempt_at <= ?)
+                    AND COALESCE(t.paused, 0) = 0
+                )
+                WHERE lane_pos <= ?
+                ORDER BY priority DESC, lane_pos ASC, id ASC
+                LIMIT ?
+                """,
+                (*CLAIMABLE_STATUSES, now, CLAIM_LANE_DEPTH, CLAIM_SCAN_LIMIT),
+            )
+            row = None
+            full_platforms = set()
+            deferred_lanes = set()
+            candidates = cur.fetchall()
+            if candidates:
+                candidates = [row for row, _ in self._fairness.rank(candidates, self._fairness.usage(cur, now))]
+            for candidate in candidates:
+                platform_type, account = candidate["platform_type"], candidate["account_file_path"]
+                if platform_type in full_platforms or (platform_type, account) in deferred_lanes:
+                    continue
+                if not self._breaker.admit(cur, breakers, candidate):
+                    continue
+                if not self._limiter.try_acquire(platform_type, account):
+                    continue
+                if self._rate_limiter.platform_full(cur, platform_type, now):
+                    self._limiter.release(platform_type, account)
+                    full_platforms.add(platform_type)
+                    continue
+                wait = self._rate_limiter.take(cur, platform_type, account, now)
+                if wait > 0:
+                    self._limiter.release(platform_type, account)
+                    self._rate_limiter.defer_account(cur, platform_type, account, now + wait)
+                    deferred_lanes.add((platform_type, account))
+                    continue
+                row = candidate
+                break
+            if not row:
+                conn.commit()
+                return None
+            try:
+                cur.execute(
+                    """
+                    UPDATE publish_task_items
+                    SET status = 'running', started_at = COALESCE(started_at, ?),
+                        lease_owner = ?, lease_expires_at = ?, heartbeat_at = ?,
+                        attempts = COALESCE(attempts, 0) + 1, next_attempt_at = NULL
+                    WHERE id = ?
+                    """,
+                    (_now_iso(), self.owner, now + self._lease_seconds, now, row["id"]),
+                )
+                conn.commit()
+            except Exception:
+                self._limiter.release(row["platform_type"], row["account_file_path"])
+                raise
+            item = dict(row)
+            item["attempts"] = int(item["attempts"] or 0) + 1
+            return item
+
+    def _finish(self, item, status, result_msg=None):
+        # guarded by lease_owner: if the lease expired and another worker took over, its result wins.
+        # A cancelled item keeps its cancel and only gives up the lease, unless the upload succeeded
+        # anyway: a cancel that came in too late to abort is replaced, the video is live either way.
+        keep_cancel = status != "success"
+        self.writer.execute(
+            """
+            UPDATE publish_task_items
+            SET status = CASE WHEN status = 'cancelled' AND ? THEN status ELSE ? END,
+                finished_at = CASE WHEN status = 'cancelled' AND ? THEN finished_at ELSE ? END,
+                result_msg = CASE
+                  WHEN status = 'cancelled' AND ? THEN result_msg
+                  WHEN status = 'cancelled' THEN ?
+                  ELSE ?
+                END,
+                lease_owner = NULL, lease_expires_at = NULL, heartbeat_at = NULL
+            WHERE id = ? AND ((lease_owner = ? AND status IN ('running', 'cancelled')) OR (? AND status = 'cancelled'))
+            """,
+            (
+                keep_cancel, status,
+                keep_cancel, _now_iso(),
+                keep_cancel, CANCEL_TOO_LATE_MSG, result_msg,
+                item["id"], self.owner, not keep_cancel,
+            ),
+            task_id=item["task_id"],
+            on_written=lambda: self._forget(item["id"]),
+        )
+
+    def _retry_later(self, item, result_msg, delay):
+        self.writer.execute(
+            """
+            UPDATE publish_task_items
+            SET status = 'pending', next_attempt_at = ?, result_msg = ?,
+                lease_owner = NULL, lease_expires_at = NULL, heartbeat_at = NULL
+            WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """,
+            (time.time() + delay, result_msg, item["id"], self.owner),
+            on_written=lambda: self._forget(item["id"]),
+        )
+
+    def _forget(self, item_id):
+        """Stop renewing an item's lease; called once its result is committed."""
+        with self._inflight_lock:
+            self._inflight.pop(item_id, None)
+
+    def _heartbeat(self):
+        with self._inflight_lock:
+            item_ids = list(self._inflight)
+        now = time.time()
+        for item_id in item_ids:
+            self.writer.execute(
+                """
+                UPDATE publish_task_items SET lease_expires_at = ?, heartbeat_at = ?
+                WHERE id = ? AND lease_owner = ? AND status IN ('running', 'cancelled')
+                """,
+                (now + self._lease_seconds, now, item_id, self.owner),
+            )
+
+    def _record_outcome(self, item, success):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            state = self._breaker.record(
+                conn.cursor(), item["platform_type"], item["account_file_path"], item["id"], success
+            )
+            conn.commit()
+        if state == OPEN and not success:
+            key = self._breaker.key_for(item["platform_type"], item["account_file_path"])
+            print(f"🚧 发布熔断 {key}: 失败率过高，剩余条目已暂缓 (deferred)")
+
+    def _lease_loop(self):
+        interval = self._lease_seconds / 3
+        while not self._stop_event.wait(interval):
+            try:
+                self._heartbeat()
+                self.recover()
+            except Exception as e:
+                print(f"⚠️ 发布租约续期失败: {e}")
+
+    def _cancelled(self, item_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM publish_task_items WHERE id = ?", (item_id,)).fetchone()
+        return row is None or row["status"] == "cancelled"
+
+    def _run(self, item):
+        """
+        Run one upload, aborting it when the item gets cancelled.
+
+        Aborting is only safe before the uploader reaches the platform's
+        publish step, so an uploader sets app.publishing = True at that
+        point. Until then a cancelled upload is aborted; past it the upload
+        runs to the end and its real outcome is recorded (see _finish).
+        """
+        app = build_uploader(
+            item["platform_type"],
+            item["title"] or "",
+            item["file_path"],
+            json.loads(item["tags_json"] or "[]"),
+            item["account_file_path"],
+            # scheduled items are only claimed once due, so they always go out right away
+            publish_date=0,
+            category=item["category"],
+            is_draft=bool(item["is_draft"]),
+            thumbnail_path=item["thumbnail_path"] or "",
+            productLink=item["product_link"] or "",
+            productTitle=item["product_title"] or "",
+        )
+        future = browser_pool.submit_upload(app)
+        waiting_noted = False
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_SECONDS)
+            except FutureTimeout:
+                pass
+            except CancelledError:
+                raise UploadCancelled("cancelled")
+            if not self._cancelled(item["id"]):
+                continue
+            if not getattr(app, "publishing", False) and future.cancel():
+                raise UploadCancelled("cancelled")
+            if not waiting_noted:
+                waiting_noted = True
+                print(f"⏳ 发布条目 {item['id']} 已取消，但上传可能已提交到平台，等待完成后记录实际结果")
+
+    def _worker_loop(self):
+        while not self._stopping:
+            item = None
+            # no room for another browser: leave the items queued in the table
+            if self._governor.try_acquire("upload"):
+                try:
+                    item = self._claim()
+                except Exception as e:
+                    print(f"⚠️ 领取发布任务失败: {e}")
+                if item is None:
+                    self._governor.release("upload")
+
+            if item is None:
+                with self._wakeup:
+                    if not self._stopping and not self._dirty:
+                        self._wakeup.wait(self._poll_interval)
+                    self._dirty = False
+                continue
+
+            with self._inflight_lock:
+                self._inflight[item["id"]] = item
+            try:
+                self._run(item)
+                status, result_msg = "success", None
+            except UploadCancelled:
+                # the API already marked the item; not an upload failure
+                status, result_msg = "cancelled", None
+                print(f"🛑 发布条目 {item['id']} 已取消，上传已中止")
+            except Exception as e:
+                traceback.print_exc()
+                status, result_msg = "failed", str(e)
+            finally:
+                self._limiter.release(item["platform_type"], item["account_file_path"])
+                self._governor.release("upload")
+                try:
+                    if status != "cancelled":
+                        self._record_outcome(item, status == "success")
+                except Exception as e:
+                    print(f"⚠️ 记录熔断状态失败 item={item['id']}: {e}")
+                # a freed slot may unblock items other workers skipped
+                self.notify()
+            try:
+                policy = policy_for(item["platform_type"])
+                # a cancelled item is not retried; _finish only hands back its lease
+                if status == "failed" and policy.should_retry(item["attempts"]) and not self._cancelled(item["id"]):
+                    delay = policy.delay(item["attempts"])
+                    print(f"🔁 发布条目 {item['id']} 第 {item['attempts']} 次失败，{delay:.0f}s 后重试")
+                    self._retry_later(
+                        item,
+                        f"attempt {item['attempts']}/{policy.max_attempts} failed: {result_msg}",
+                        delay,
+                    )
+                else:
+                    self._finish(item, status, result_msg)
+            except Exception as e:
+                self._forget(item["id"])
+                print(f"⚠️ 更新发布状态失败 item={item['id']}: {e}")
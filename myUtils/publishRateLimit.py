@@ -0,0 +1,122 @@
+import time
+
+import conf
+
+# 发布速率限制：key 为平台 type，"default" 为兜底
+# uploads_per_hour: 单账号每小时最多上传数（令牌桶补充速度，0 表示不限）；burst: 令牌桶容量
+# platform_sessions: 该平台在所有 worker 进程中同时进行的上传数上限（0 表示不限）
+PUBLISH_RATE_LIMITS = getattr(conf, "PUBLISH_RATE_LIMITS", {})
+
+DEFAULT_RATE_LIMIT = {"uploads_per_hour": 0, "burst": 1, "platform_sessions": 0}
+
+
+class RateLimit:
+    def __init__(self, uploads_per_hour=0, burst=1, platform_sessions=0):
+        self.uploads_per_hour = max(0.0, float(uploads_per_hour))
+        self.burst = max(1.0, float(burst))
+        self.platform_sessions = max(0, int(platform_sessions))
+
+    @property
+    def refill_per_second(self):
+        return self.uploads_per_hour / 3600.0
+
+
+def rate_limit_for(platform_type, limits=None):
+    limits = PUBLISH_RATE_LIMITS if limits is None else limits
+    options = dict(DEFAULT_RATE_LIMIT)
+    options.update(limits.get("default", {}))
+    options.update(limits.get(platform_type, limits.get(str(platform_type), {})))
+    return RateLimit(**options)
+
+
+def _bucket_key(platform_type, account):
+    return f"{int(platform_type)}:{account}"
+
+
+class PublishRateLimiter:
+    """
+    Per-account token buckets and per-platform session caps kept in the database.
+
+    Bucket state lives in publish_rate_buckets and live sessions are counted
+    from leased 'running' items, so every worker process sees the same limits.
+    The check-and-take methods run on the caller's cursor: inside the queue's
+    BEGIN IMMEDIATE claim they are atomic across processes.
+    """
+
+    def __init__(self, limits=None):
+        self._limits = limits
+
+    def limit_for(self, platform_type):
+        return rate_limit_for(platform_type, self._limits)
+
+    def take(self, cur, platform_type, account, now=None):
+        """
+        Take one upload token for the account.
+
+        Returns 0.0 when a token was taken, otherwise the seconds until the
+        next token becomes available (nothing is taken in that case).
+        """
+        limit = self.limit_for(platform_type)
+        if not limit.uploads_per_hour:
+            return 0.0
+        now = time.time() if now is None else now
+        key = _bucket_key(platform_type, account)
+        cur.execute("SELECT tokens, updated_at FROM publish_rate_buckets WHERE bucket = ?", (key,))
+        row = cur.fetchone()
+        if row is None:
+            tokens = limit.burst
+        else:
+            elapsed = max(0.0, now - float(row["updated_at"]))
+            tokens = min(limit.burst, float(row["tokens"]) + elapsed * limit.refill_per_second)
+        if tokens < 1.0:
+            return (1.0 - tokens) / limit.refill_per_second
+        cur.execute(
+            """
+            INSERT INTO publish_rate_buckets (bucket, tokens, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            """,
+            (key, tokens - 1.0, now),
+        )
+        return 0.0
+
+    def platform_full(self, cur, platform_type, now=None):
+        """True when the platform already has platform_sessions live uploads across all workers."""
+        limit = self.limit_for(platform_type)
+        if not limit.platform_sessions:
+            return False
+        now = time.time() if now is None else now
+        cur.execute(
+            """
+            SELECT COUNT(*) FROM publish_task_items i
+            JOIN publish_tasks t ON t.id = i.task_id
+            WHERE i.status IN ('running', 'cancelled') AND i.lease_expires_at >= ? AND t.platform_type = ?
+            """,
+            (now, int(platform_type)),
+        )
+        return int(cur.fetchone()[0]) >= limit.platform_sessions
+
+    def defer_account(self, cur, platform_type, account, until):
+        """Hold the account's pending items back until its next token, so claims skip the lane meanwhile."""
+        cur.execute(
+            """
+            UPDATE publish_task_items
+            SET next_attempt_at = MAX(COALESCE(next_attempt_at, 0), ?)
+            WHERE status = 'pending' AND account_file_path = ?
+              AND task_id IN (SELECT id FROM publish_tasks WHERE platform_type = ?)
+            """,
+            (until, account, int(platform_type)),
+        )
+
+    def snapshot(self, cur, now=None):
+        """Current token count per bucket (refilled up to now, not written back)."""
+        now = time.time() if now is None else now
+        cur.execute("SELECT bucket, tokens, updated_at FROM publish_rate_buckets ORDER BY bucket")
+        buckets = {}
+        for r in cur.fetchall():
+            limit = self.limit_for(int(r["bucket"].split(":", 1)[0]))
+            elapsed = max(0.0, now - float(r["updated_at"]))
+            buckets[r["bucket"]] = round(min(limit.burst, float(r["tokens"]) + elapsed * limit.refill_per_second), 3)
+        return buckets
+
+
+publish_rate_limiter = PublishRateLimiter()
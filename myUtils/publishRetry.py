@@ -0,0 +1,33 @@
+import random
+
+import conf
+
+# 重试策略：key 为平台 type，"default" 为兜底；delay = base * 2^(attempt-1)，上限 max，再乘以 [1-jitter, 1+jitter]
+PUBLISH_RETRY_POLICY = getattr(conf, "PUBLISH_RETRY_POLICY", {})
+
+DEFAULT_POLICY = {"max_attempts": 3, "base_delay": 30, "max_delay": 600, "jitter": 0.2}
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=30, max_delay=600, jitter=0.2):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.jitter = min(max(float(jitter), 0.0), 1.0)
+
+    def should_retry(self, attempts):
+        """attempts: how many times the item has been tried, including the one that just failed."""
+        return attempts < self.max_attempts
+
+    def delay(self, attempts):
+        """Seconds to wait before the next try: exponential backoff with +/- jitter."""
+        raw = min(self.max_delay, self.base_delay * (2 ** max(attempts - 1, 0)))
+        return raw * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def policy_for(platform_type, policies=None):
+    policies = PUBLISH_RETRY_POLICY if policies is None else policies
+    options = dict(DEFAULT_POLICY)
+    options.update(policies.get("default", {}))
+    options.update(policies.get(platform_type, policies.get(str(platform_type), {})))
+    return RetryPolicy(**options)
@@ -0,0 +1,130 @@
+import datetime as dt
+import heapq
+import threading
+import time
+
+
+# 全量重建间隔（秒）：兜底其他进程写入或手工修改的定时条目
+REBUILD_INTERVAL = 600
+
+
+def scheduled_epoch(scheduled_at):
+    """scheduled_at is stored as a naive local ISO string; returns epoch seconds or None."""
+    if not scheduled_at:
+        return None
+    try:
+        return dt.datetime.fromisoformat(str(scheduled_at)).timestamp()
+    except ValueError:
+        return None
+
+
+class ScheduleDispatcher:
+    """
+    Releases 'scheduled' publish items to the queue when their time comes.
+
+    Keeps a min-heap of (due_epoch, item_id) and sleeps until the earliest one
+    is due, then flips the due rows from 'scheduled' to 'pending' and wakes the
+    queue. Nothing is uploaded before its time, so browser load follows the
+    schedule instead of spiking at submit time. The heap is rebuilt from the
+    table on start (and every REBUILD_INTERVAL) so it survives restarts.
+    """
+
+    def __init__(self, connect, on_due=None):
+        self._connect = connect
+        self._on_due = on_due
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._last_rebuild = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self.rebuild()
+        self._thread = threading.Thread(target=self._loop, name="publish-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def add(self, item_id, scheduled_at):
+        due = scheduled_epoch(scheduled_at)
+        if due is None:
+            return
+        with self._cond:
+            heapq.heappush(self._heap, (due, int(item_id)))
+            self._cond.notify_all()
+
+    def rebuild(self):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id, scheduled_at FROM publish_task_items WHERE status = 'scheduled'")
+            rows = cur.fetchall()
+        heap = []
+        for r in rows:
+            due = scheduled_epoch(r["scheduled_at"])
+            # unparsable timestamps are released right away rather than stuck forever
+            heap.append((due if due is not None else 0.0, int(r["id"])))
+        heapq.heapify(heap)
+        with self._cond:
+            self._heap = heap
+            self._last_rebuild = time.time()
+            self._cond.notify_all()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._heap)
+
+    def next_due(self):
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now):
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now:
+            due_ids.append(heapq.heappop(self._heap)[1])
+        return due_ids
+
+    def _release(self, item_ids):
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE publish_task_items SET status = 'pending' WHERE id = ? AND status = 'scheduled'",
+                [(item_id,) for item_id in item_ids],
+            )
+        print(f"⏰ {len(item_ids)} 个定时发布条目已到期，进入发布队列")
+        if self._on_due:
+            self._on_due()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                now = time.time()
+                due_ids = self._pop_due(now)
+                if not due_ids:
+                    wake_at = self._last_rebuild + REBUILD_INTERVAL
+                    if self._heap:
+                        wake_at = min(wake_at, self._heap[0][0])
+                    self._cond.wait(max(0.0, wake_at - now))
+                    needs_rebuild = time.time() - self._last_rebuild >= REBUILD_INTERVAL
+                else:
+                    needs_rebuild = False
+            try:
+                if due_ids:
+                    self._release(due_ids)
+                elif needs_rebuild:
+                    self.rebuild()
+            except Exception as e:
+                print(f"⚠️ 定时发布调度失败: {e}")
+                with self._cond:
+                    if due_ids:
+                        # put them back and try again shortly
+                        for item_id in due_ids:
+                            heapq.heappush(self._heap, (time.time() + 5, item_id))
+                    else:
+                        self._last_rebuild = time.time()
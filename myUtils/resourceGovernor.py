@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+
+import psutil
+
+import conf
+from myUtils.browserPool import browser_pool
+
+# 资源上限：同时存在的浏览器会话（上传 + 登录 + 预检 cookie 校验）、本进程及子进程（浏览器）总内存（MB）、系统 CPU 使用率（%）；0 表示不限
+RESOURCE_MAX_SESSIONS = getattr(conf, "RESOURCE_MAX_SESSIONS", 6)
+RESOURCE_MAX_RSS_MB = getattr(conf, "RESOURCE_MAX_RSS_MB", 0)
+RESOURCE_MAX_CPU_PERCENT = getattr(conf, "RESOURCE_MAX_CPU_PERCENT", 0)
+# 超过上限时最多排队等待的请求数（再多则返回 429）及建议的重试间隔（秒）
+RESOURCE_MAX_WAITING = getattr(conf, "RESOURCE_MAX_WAITING", 8)
+RESOURCE_RETRY_AFTER = getattr(conf, "RESOURCE_RETRY_AFTER", 10)
+
+# how long a resource sample is reused before psutil is asked again (seconds)
+SAMPLE_INTERVAL = 1.0
+
+
+class GovernorBusy(Exception):
+    """Raised when the admission queue is full; the client should retry later."""
+
+
+class ResourceGovernor:
+    """
+    Admission control for browser-heavy work (uploads, logins and pre-flight
+    cookie checks).
+
+    A new session is admitted only while the live session count, the RSS of
+    this process plus its children (Chromium) and the system CPU usage are
+    all under their ceilings. Anything else waits: queue workers simply leave
+    the item in the table, logins and cookie checks wait in acquire_async().
+    When more than max_waiting callers are already waiting, check_waiting()
+    raises GovernorBusy so the API can answer 429.
+
+    Idle pooled browsers count towards the RSS too, and nothing else would
+    close them while no upload runs, so an admission refused for memory
+    calls on_memory_pressure (BrowserPool.trim_idle) to free them.
+    """
+
+    def __init__(
+        self,
+        max_sessions=RESOURCE_MAX_SESSIONS,
+        max_rss_mb=RESOURCE_MAX_RSS_MB,
+        max_cpu_percent=RESOURCE_MAX_CPU_PERCENT,
+        max_waiting=RESOURCE_MAX_WAITING,
+        retry_after=RESOURCE_RETRY_AFTER,
+        on_memory_pressure=None,
+    ):
+        self.max_sessions = max(0, int(max_sessions))
+        self.max_rss_mb = float(max_rss_mb or 0)
+        self.max_cpu_percent = float(max_cpu_percent or 0)
+        self.max_waiting = max(0, int(max_waiting))
+        self.retry_after = max(1, int(retry_after))
+        self._on_memory_pressure = on_memory_pressure
+        self._cond = threading.Condition()
+        self._sessions = {}  # kind -> count
+        self._waiting = 0
+        self._rejected = 0
+        self._sample = (0.0, 0.0)
+        self._sampled_at = 0.0
+
+    def _resources(self):
+        now = time.monotonic()
+        if now - self._sampled_at >= SAMPLE_INTERVAL:
+            rss = 0
+            proc = psutil.Process()
+            for p in [proc] + proc.children(recursive=True):
+                try:
+                    rss += p.memory_info().rss
+                except psutil.Error:
+                    continue
+            # interval=None compares with the previous call, so it never blocks
+            self._sample = (rss / (1024 * 1024), psutil.cpu_percent(interval=None))
+            self._sampled_at = now
+        return self._sample
+
+    def _blocked_by(self):
+        """Name of the first ceiling that is reached, or None."""
+        if self.max_sessions and sum(self._sessions.values()) >= self.max_sessions:
+            return "sessions"
+        if self.max_rss_mb or self.max_cpu_percent:
+            rss_mb, cpu = self._resources()
+            if self.max_rss_mb and rss_mb >= self.max_rss_mb:
+                return "memory"
+            if self.max_cpu_percent and cpu >= self.max_cpu_percent:
+                return "cpu"
+        return None
+
+    def _take(self, kind):
+        self._sessions[kind] = self._sessions.get(kind, 0) + 1
+
+    def check_waiting(self):
+        """Raise GovernorBusy when the admission queue is already full."""
+        with self._cond:
+            if self._waiting >= self.max_waiting and self._blocked_by():
+                self._rejected += 1
+                raise GovernorBusy(f"服务器繁忙，请 {self.retry_after} 秒后重试")
+
+    def try_acquire(self, kind):
+        with self._cond:
+            blocked = self._blocked_by()
+            if blocked:
+                # only on admission: stats() and check_waiting() must not close browsers
+                if blocked == "memory" and self._on_memory_pressure is not None:
+                    self._on_memory_pressure()
+                return False
+            self._take(kind)
+            return True
+
+    async def acquire_async(self, kind):
+        """Wait on the shared runtime loop until a session is admitted."""
+        with self._cond:
+            self._waiting += 1
+        try:
+            while not self.try_acquire(kind):
+                await asyncio.sleep(SAMPLE_INTERVAL)
+        finally:
+            with self._cond:
+                self._waiting -= 1
+
+    def release(self, kind):
+        with self._cond:
+            self._sessions[kind] = max(0, self._sessions.get(kind, 0) - 1)
+
+    def stats(self):
+        with self._cond:
+            rss_mb, cpu = self._resources()
+            return {
+                "sessions": dict(self._sessions),
+                "max_sessions": self.max_sessions,
+                "rss_mb": round(rss_mb, 1),
+                "cpu_percent": cpu,
+                "waiting": self._waiting,
+                "rejected": self._rejected,
+                "blocked_by": self._blocked_by(),
+            }
+
+
+resource_governor = ResourceGovernor(on_memory_pressure=browser_pool.trim_idle)
@@ -0,0 +1,172 @@
+import atexit
+import queue
+import threading
+import time
+
+import conf
+
+# 攒批写入：最长等待时间（秒）与单批最大条数
+STATUS_FLUSH_INTERVAL = getattr(conf, "STATUS_FLUSH_INTERVAL", 0.2)
+STATUS_MAX_BATCH = getattr(conf, "STATUS_MAX_BATCH", 200)
+
+# backoff for a statement that failed on its own: doubles per attempt up to the cap (seconds)
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+
+class StatusWriter:
+    """
+    Write-behind writer for publish status updates.
+
+    Workers hand their UPDATE statements to execute() and move on; a single
+    thread drains the queue and applies everything that arrived within
+    flush_interval (or max_batch statements) in one transaction, then lets
+    on_batch(conn, task_ids) roll task status up once per touched task.
+    stop() - also registered with atexit - drains the queue before returning.
+
+    When a batch fails its statements are retried one by one, and a
+    statement that still fails is kept and retried with backoff rather than
+    dropped: a lost finish would let the lease expire and the item be
+    uploaded again. on_written, if given, runs once the statement committed.
+    """
+
+    def __init__(self, connect, on_batch=None, flush_interval=STATUS_FLUSH_INTERVAL, max_batch=STATUS_MAX_BATCH):
+        self._connect = connect
+        self._on_batch = on_batch
+        self.flush_interval = flush_interval
+        self.max_batch = max(1, int(max_batch))
+        self._queue = queue.Queue()
+        self._retries = []  # (due, attempt, statement), only touched by the writer thread
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="status-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def execute(self, sql, params=(), task_id=None, on_written=None):
+        """Queue one statement; task_id marks a task whose status should be re-derived."""
+        self.start()
+        self._queue.put((sql, tuple(params), task_id, on_written))
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "retrying": len(self._retries),
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+    def _collect(self):
+        timeout = None
+        if self._retries:
+            # wake up for the next retry even when nothing new arrives
+            timeout = max(0.0, min(due for due, _, _ in self._retries) - time.monotonic())
+        try:
+            first = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        batch = [first]
+        if first is None:
+            return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(entry)
+            if entry is None:
+                break
+        return batch
+
+    def _write(self, statements):
+        task_ids = {task_id for _, _, task_id, _ in statements if task_id is not None}
+        with self._connect() as conn:
+            cur = conn.cursor()
+            for sql, params, _, _ in statements:
+                cur.execute(sql, params)
+            if self._on_batch and task_ids:
+                self._on_batch(conn, task_ids)
+            conn.commit()
+        for _, _, _, on_written in statements:
+            if on_written is not None:
+                try:
+                    on_written()
+                except Exception as e:
+                    print(f"⚠️ 状态写入回调失败: {e}")
+
+    def _write_or_retry(self, statement, attempt=0):
+        """Write one statement; on failure keep it for a later retry. Returns the number written."""
+        try:
+            self._write([statement])
+            return 1
+        except Exception as e:
+            self.failures += 1
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+            self._retries.append((time.monotonic() + delay, attempt + 1, statement))
+            print(f"⚠️ 状态写入失败，{delay:.1f} 秒后重试: {' '.join(statement[0].split()[:3])} {e}")
+            return 0
+
+    def _write_one_by_one(self, statements):
+        return sum(self._write_or_retry(statement) for statement in statements)
+
+    def _retry_due(self, force=False):
+        now = time.monotonic()
+        due = [r for r in self._retries if force or r[0] <= now]
+        self._retries = [r for r in self._retries if not (force or r[0] <= now)]
+        for _, attempt, statement in due:
+            self.written += self._write_or_retry(statement, attempt)
+
+    def _loop(self):
+        while True:
+            self._retry_due()
+            batch = self._collect()
+            statements = [e for e in batch if isinstance(e, tuple)]
+            if statements:
+                try:
+                    self._write(statements)
+                    self.written += len(statements)
+                except Exception as e:
+                    print(f"⚠️ 状态批量写入失败，逐条重试: {e}")
+                    time.sleep(0.5)
+                    self.written += self._write_one_by_one(statements)
+                self.batches += 1
+            if any(entry is None for entry in batch):
+                # drain whatever was queued behind the stop marker, then exit
+                rest = []
+                while True:
+                    try:
+                        rest.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                statements = [e for e in rest if isinstance(e, tuple)]
+                if statements:
+                    self.written += self._write_one_by_one(statements)
+                # last chance for statements still waiting on their backoff
+                self._retry_due(force=True)
+                if self._retries:
+                    print(f"⚠️ 退出时仍有 {len(self._retries)} 条状态未能写入，相关条目将在租约过期后重新排队")
+                return
@@ -0,0 +1,184 @@
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+
+import conf
+from conf import BASE_DIR
+from myUtils.materialStore import video_dir
+
+# 缩略图：ffmpeg 路径、允许的宽度（像素，第一个为默认值）、单次生成超时（秒）与同时生成数
+FFMPEG_PATH = getattr(conf, "FFMPEG_PATH", "ffmpeg")
+THUMB_WIDTHS = tuple(getattr(conf, "THUMB_WIDTHS", (320, 160, 640)))
+THUMB_TIMEOUT = getattr(conf, "THUMB_TIMEOUT", 60)
+THUMB_CONCURRENCY = getattr(conf, "THUMB_CONCURRENCY", 2)
+# 预览雪碧图：帧数与每行帧数
+THUMB_SPRITE_FRAMES = getattr(conf, "THUMB_SPRITE_FRAMES", 10)
+THUMB_SPRITE_COLUMNS = getattr(conf, "THUMB_SPRITE_COLUMNS", 5)
+
+KINDS = ("poster", "sprite")
+# browser cache lifetime of /thumb responses; a cached image never changes for its key
+THUMB_MAX_AGE = 365 * 24 * 3600
+
+
+class ThumbnailUnavailable(Exception):
+    """No thumbnail can be produced (ffmpeg missing, file missing or undecodable)."""
+
+
+class ThumbnailPending(ThumbnailUnavailable):
+    """The media probe has not measured the duration yet; ask again later."""
+
+
+def cache_dir():
+    return Path(BASE_DIR / "thumbCache")
+
+
+def cache_key(record):
+    """Digest for content-addressed rows; older rows are keyed by id and mtime of their file."""
+    if record.get("digest"):
+        return record["digest"]
+    try:
+        mtime = int(os.path.getmtime(video_dir() / str(record["file_path"])))
+    except OSError:
+        raise ThumbnailUnavailable("视频文件不存在")
+    return f"file-{record['id']}-{mtime}"
+
+
+def cache_path(key, kind, width):
+    return cache_dir() / key[:2] / f"{key}_{kind}_{width}.jpg"
+
+
+def purge(key):
+    """Remove every cached image of a key, e.g. once the last reference to a blob is gone."""
+    for path in (cache_dir() / key[:2]).glob(f"{key}_*.jpg"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def normalize_width(width):
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return THUMB_WIDTHS[0]
+    return width if width in THUMB_WIDTHS else THUMB_WIDTHS[0]
+
+
+_ffmpeg = None
+
+
+def _ffmpeg_binary():
+    global _ffmpeg
+    if _ffmpeg is None:
+        _ffmpeg = shutil.which(FFMPEG_PATH) or ""
+    return _ffmpeg
+
+
+def _ffmpeg_args(kind, source, width, duration):
+    if kind == "poster":
+        # a frame a little way in is more telling than the (often black) first one
+        at = min(1.0, duration * 0.1) if duration else 0.0
+        return ["-ss", f"{at:.3f}", "-i", str(source), "-frames:v", "1", "-vf", f"scale={width}:-2", "-q:v", "4"]
+    frames = max(1, int(THUMB_SPRITE_FRAMES))
+    columns = max(1, min(frames, int(THUMB_SPRITE_COLUMNS)))
+    rows = -(-frames // columns)
+    tile_width = max(32, width // 2)
+    fps = frames / duration if duration else 1.0
+    # keyframes only: a sprite of a long video never decodes the whole stream
+    return [
+        "-skip_frame", "nokey", "-i", str(source),
+        "-vf", f"fps={fps:.6f},scale={tile_width}:-2,tile={columns}x{rows}",
+        "-frames:v", "1", "-q:v", "5",
+    ]
+
+
+class ThumbnailCache:
+    """
+    Poster frames and preview sprites on disk under thumbCache/, keyed by
+    file digest, kind and width.
+
+    Content-addressed files never change, so a cached image is valid
+    forever and duplicates share one set of thumbnails. Generation runs
+    ffmpeg at most `concurrency` times in parallel; concurrent requests for
+    the same image wait for the first one instead of running ffmpeg again.
+    """
+
+    def __init__(self, concurrency=THUMB_CONCURRENCY, timeout=THUMB_TIMEOUT):
+        self._slots = threading.BoundedSemaphore(max(1, int(concurrency)))
+        self._timeout = timeout
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._generated = 0
+        self._failed = 0
+
+    def _key_lock(self, path):
+        with self._locks_lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def get(self, record, kind="poster", width=None):
+        """Path of the cached image, generating it first when needed."""
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}")
+        # frame times depend on the duration; an image rendered without it would be cached for good
+        if not record.get("duration") and record.get("probe_status") in (None, "probing"):
+            raise ThumbnailPending("素材尚未探测完成，请稍后重试")
+        path = cache_path(cache_key(record), kind, normalize_width(width))
+        if path.exists():
+            return path
+        lock = self._key_lock(path)
+        try:
+            with lock:
+                if not path.exists():
+                    self._generate(record, kind, normalize_width(width), path)
+        finally:
+            with self._locks_lock:
+                self._locks.pop(path, None)
+        return path
+
+    def _generate(self, record, kind, width, path):
+        binary = _ffmpeg_binary()
+        if not binary:
+            raise ThumbnailUnavailable("未安装 ffmpeg，无法生成缩略图")
+        source = video_dir() / str(record["file_path"])
+        if not source.exists():
+            raise ThumbnailUnavailable("视频文件不存在")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{uuid.uuid4().hex}.jpg")
+        args = _ffmpeg_args(kind, source, width, record.get("duration"))
+        with self._slots:
+            try:
+                proc = subprocess.run(
+                    [binary, "-v", "error", "-y", *args, str(temp_path)], capture_output=True, timeout=self._timeout
+                )
+            except subprocess.TimeoutExpired:
+                proc = None
+        if proc is None or proc.returncode != 0 or not temp_path.exists():
+            self._failed += 1
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            reason = "timed out" if proc is None else proc.stderr.decode("utf-8", "replace").strip()[:300]
+            raise ThumbnailUnavailable(f"缩略图生成失败: {reason}")
+        os.replace(temp_path, path)
+        self._generated += 1
+
+    def warm(self, record):
+        """Pre-generate the default poster and sprite; errors are only logged."""
+        if not _ffmpeg_binary():
+            return
+        for kind in KINDS:
+            try:
+                self.get(record, kind)
+            except ThumbnailUnavailable as e:
+                print(f"⚠️ {record.get('file_path')}: {e}")
+                return
+
+    def stats(self):
+        return {"ffmpeg": bool(_ffmpeg_binary()), "generated": self._generated, "failed": self._failed}
+
+
+thumbnail_cache = ThumbnailCache()
@@ -1,15 +1,9 @@
-import asyncio
-import base64
 import datetime as dt
-import hashlib
-import hmac
 import json
 import os
-import secrets
 import sqlite3
 import threading
 import time
-import uuid
 from pathlib import Path
 from queue import Queue
 from typing import Any, Dict, Optional, Tuple
@@ -19,9 +13,27 @@ from myUtils.auth import check_cookie
 from flask import Flask, Response, g, jsonify, request, send_from_directory
 from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
 
+import conf
 from conf import ACCESS_TOKEN_EXPIRES_IN, ADMIN_PASSWORD, ADMIN_USERNAME, APP_SECRET_KEY, BASE_DIR
+from myUtils.asyncRuntime import runtime as async_runtime
+from myUtils.authCache import TTLCache
+from myUtils import chunkedUpload, materialStore
+from myUtils.db import connect as _db_connect
+from myUtils.fileServing import serve_file
+from myUtils.migrations import migrate
 from myUtils.login import get_tencent_cookie, douyin_cookie_gen, get_ks_cookie, xiaohongshu_cookie_gen
-from myUtils.postVideo import post_video_tencent, post_video_DouYin, post_video_ks, post_video_xhs
+from myUtils.mediaProbe import MediaProber
+from myUtils.passwords import HasherBusy, password_hasher
+from myUtils.preflight import PREFLIGHT_ENABLED, invalid_pairs, preflight
+from myUtils.publishBreaker import publish_breaker
+from myUtils.publishFairness import fair_order
+from myUtils.publishLimits import PUBLISH_MAX_CONCURRENCY, publish_limiter
+from myUtils.publishQueue import PublishQueue, refresh_task_status
+from myUtils.publishRateLimit import publish_rate_limiter
+from myUtils.publishScheduler import ScheduleDispatcher
+from myUtils.resourceGovernor import GovernorBusy, resource_governor
+from myUtils import thumbnails
+from myUtils.thumbnails import THUMB_MAX_AGE, ThumbnailPending, ThumbnailUnavailable, thumbnail_cache
 
 active_queues = {}
 app = Flask(__name__)
@@ -36,7 +48,18 @@ app.config['MAX_CONTENT_LENGTH'] = 160 * 1024 * 1024
 # 获取当前目录（假设 index.html 和 assets 在这里）
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
-DB_PATH = Path(BASE_DIR / "db" / "database.db")
+# 后台发布 worker 线程数（conf.py 未配置时与全局并发上限一致）
+PUBLISH_WORKERS = getattr(conf, "PUBLISH_WORKERS", PUBLISH_MAX_CONCURRENCY)
+# False 时本进程只负责写入任务表，由独立的 `python -m sau_worker` 进程领取并上传
+PUBLISH_EMBEDDED_WORKERS = getattr(conf, "PUBLISH_EMBEDDED_WORKERS", True)
+# 队列中等待上传的条目上限（pending + deferred），超过后 /postVideo 返回 429；0 表示不限
+PUBLISH_MAX_QUEUED_ITEMS = getattr(conf, "PUBLISH_MAX_QUEUED_ITEMS", 1000)
+# 发布任务优先级的取值范围 [-N, N]，数值越大越先发布
+PUBLISH_MAX_PRIORITY = getattr(conf, "PUBLISH_MAX_PRIORITY", 10)
+
+# 已验证 token -> 用户 的进程内缓存（秒 / 条数）
+AUTH_CACHE_TTL = getattr(conf, "AUTH_CACHE_TTL", 60)
+AUTH_CACHE_SIZE = getattr(conf, "AUTH_CACHE_SIZE", 1024)
 
 
 def api_response(*, code: int, msg: Optional[str], data: Any, http_status: int):
@@ -51,92 +74,11 @@ def fail(code: int, msg: str, http_status: Optional[int] = None):
     return api_response(code=code, msg=msg, data=None, http_status=http_status or code)
 
 
-def _db_connect():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def ensure_tables():
-    """Ensure required tables exist (idempotent)."""
-    with _db_connect() as conn:
-        cur = conn.cursor()
-
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS user_info (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                type INTEGER NOT NULL,
-                filePath TEXT NOT NULL,
-                userName TEXT NOT NULL,
-                status INTEGER DEFAULT 0
-            )
-            """
-        )
-
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS file_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                filename TEXT NOT NULL,
-                filesize REAL,
-                upload_time DATETIME DEFAULT CURRENT_TIMESTAMP,
-                file_path TEXT
-            )
-            """
-        )
-
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS app_users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'user',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_login_at DATETIME
-            )
-            """
-        )
-
-        # publish tables are created here too (so backend works even if createTable.py wasn't run)
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS publish_tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                platform_type INTEGER NOT NULL,
-                title TEXT,
-                tags_json TEXT,
-                enable_timer INTEGER DEFAULT 0,
-                videos_per_day INTEGER DEFAULT 1,
-                daily_times_json TEXT,
-                start_days INTEGER DEFAULT 0,
-                product_link TEXT,
-                product_title TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'created',
-                error_msg TEXT
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS publish_task_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id INTEGER NOT NULL,
-                file_path TEXT NOT NULL,
-                account_file_path TEXT NOT NULL,
-                scheduled_at DATETIME,
-                started_at DATETIME,
-                finished_at DATETIME,
-                status TEXT DEFAULT 'pending',
-                result_msg TEXT
-            )
-            """
-        )
-
-        conn.commit()
+def fail_retry(code: int, msg: str, retry_after: int = 1):
+    """fail() plus a Retry-After header, for 429/503 responses the client should retry."""
+    resp, status = fail(code, msg, code)
+    resp.headers["Retry-After"] = str(int(retry_after))
+    return resp, status
 
 
 def _now_iso():
@@ -162,39 +104,23 @@ def normalize_daily_times(daily_times):
     return out or None
 
 
-def hash_password(password: str, *, iterations: int = 200_000) -> str:
-    salt = secrets.token_bytes(16)
-    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
-    return "pbkdf2_sha256${}${}${}".format(
-        iterations,
-        base64.b64encode(salt).decode("utf-8"),
-        base64.b64encode(dk).decode("utf-8"),
-    )
+_token_serializer = URLSafeTimedSerializer(APP_SECRET_KEY, salt="access-token-v1")
 
 
-def verify_password(password: str, stored: str) -> bool:
-    try:
-        algo, iters_s, salt_b64, dk_b64 = stored.split("$", 3)
-        if algo != "pbkdf2_sha256":
-            return False
-        iters = int(iters_s)
-        salt = base64.b64decode(salt_b64.encode("utf-8"))
-        dk_expected = base64.b64decode(dk_b64.encode("utf-8"))
-        dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iters)
-        return hmac.compare_digest(dk, dk_expected)
-    except Exception:
-        return False
+def issue_access_token(payload: Dict[str, Any]) -> str:
+    return _token_serializer.dumps(payload)
 
 
-_token_serializer = URLSafeTimedSerializer(APP_SECRET_KEY, salt="access-token-v1")
+def verify_access_token(token: str, return_timestamp: bool = False):
+    return _token_serializer.loads(token, max_age=ACCESS_TOKEN_EXPIRES_IN, return_timestamp=return_timestamp)
 
 
-def issue_access_token(payload: Dict[str, Any]) -> str:
-    return _token_serializer.dumps(payload)
+auth_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
 
-def verify_access_token(token: str) -> Dict[str, Any]:
-    return _token_serializer.loads(token, max_age=ACCESS_TOKEN_EXPIRES_IN)
+def invalidate_cached_user(uid: int):
+    """Call whenever an app_users row changes so cached tokens re-read it."""
+    auth_cache.discard_where(lambda user: user.get("id") == uid)
 
 
 def get_token_from_request() -> Optional[str]:
@@ -210,8 +136,14 @@ def require_auth():
     if not token:
         return None, fail(401, "Unauthorized", 401)
 
+    cached = auth_cache.get(token)
+    if cached is not None:
+        user = dict(cached)
+        g.current_user = user
+        return user, None
+
     try:
-        payload = verify_access_token(token)
+        payload, issued_at = verify_access_token(token, return_timestamp=True)
     except SignatureExpired:
         return None, fail(401, "Token expired", 401)
     except BadSignature:
@@ -232,14 +164,16 @@ def require_auth():
             return None, fail(401, "User not found", 401)
 
         user = dict(row)
-        g.current_user = user
-        return user, None
 
+    # never cache a token beyond its own expiry
+    token_ttl = issued_at.timestamp() + ACCESS_TOKEN_EXPIRES_IN - time.time()
+    auth_cache.set(token, dict(user), ttl=token_ttl)
+    g.current_user = user
+    return user, None
 
-@app.before_request
-def _bootstrap_and_auth_guard():
-    ensure_tables()
 
+@app.before_request
+def _auth_guard():
     # allow CORS preflight
     if request.method == "OPTIONS":
         return None
@@ -297,21 +231,29 @@ def auth_register():
         cur.execute("SELECT COUNT(1) AS c FROM app_users")
         has_any = (cur.fetchone()["c"] or 0) > 0
 
-        if has_any:
-            # Only admin can create more users
-            user, err = require_auth()
-            if err:
-                return err
-            if (user.get("role") or "") != "admin":
-                return fail(403, "Forbidden", 403)
-            role = payload.get("role") or "user"
-        else:
-            role = "admin"
+    if has_any:
+        # Only admin can create more users
+        user, err = require_auth()
+        if err:
+            return err
+        if (user.get("role") or "") != "admin":
+            return fail(403, "Forbidden", 403)
+        role = payload.get("role") or "user"
+    else:
+        role = "admin"
+
+    # hash outside of any DB connection: it takes a while and runs in the hasher pool
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return fail_retry(503, "Server busy, please retry", 1)
 
+    with _db_connect() as conn:
+        cur = conn.cursor()
         try:
             cur.execute(
                 "INSERT INTO app_users (username, password_hash, role, created_at) VALUES (?, ?, ?, ?)",
-                (username, hash_password(password), role, _now_iso()),
+                (username, password_hash, role, _now_iso()),
             )
             conn.commit()
         except sqlite3.IntegrityError:
@@ -328,32 +270,52 @@ def auth_login():
     if not username or not password:
         return fail(400, "username/password required", 400)
 
-    with _db_connect() as conn:
-        cur = conn.cursor()
+    try:
+        with _db_connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(1) AS c FROM app_users")
+            user_count = int(cur.fetchone()["c"] or 0)
+
         # bootstrap: if no users exist, allow logging in with conf admin to auto-create the first admin
-        cur.execute("SELECT COUNT(1) AS c FROM app_users")
-        user_count = int(cur.fetchone()["c"] or 0)
         if user_count == 0:
             if username == (ADMIN_USERNAME or "").strip() and password == (ADMIN_PASSWORD or ""):
-                cur.execute(
-                    "INSERT INTO app_users (username, password_hash, role, created_at, last_login_at) VALUES (?, ?, ?, ?, ?)",
-                    (username, hash_password(password), "admin", _now_iso(), _now_iso()),
-                )
-                conn.commit()
+                admin_hash = password_hasher.hash(password)
+                with _db_connect() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO app_users (username, password_hash, role, created_at, last_login_at) VALUES (?, ?, ?, ?, ?)",
+                        (username, admin_hash, "admin", _now_iso(), _now_iso()),
+                    )
             else:
                 return fail(401, "No users yet. Use configured admin credentials or call /auth/register first.", 401)
 
-        cur.execute("SELECT * FROM app_users WHERE username = ?", (username,))
-        row = cur.fetchone()
+        with _db_connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT * FROM app_users WHERE username = ?", (username,))
+            row = cur.fetchone()
         if not row:
             return fail(401, "Invalid username or password", 401)
 
         user = dict(row)
-        if not verify_password(password, user.get("password_hash") or ""):
+        stored_hash = user.get("password_hash") or ""
+        if not password_hasher.verify(password, stored_hash):
             return fail(401, "Invalid username or password", 401)
 
-        cur.execute("UPDATE app_users SET last_login_at = ? WHERE id = ?", (_now_iso(), user["id"]))
+        # the configured cost changed since this hash was made: upgrade it while we know the password
+        new_hash = password_hasher.hash(password) if password_hasher.needs_rehash(stored_hash) else None
+    except HasherBusy:
+        return fail_retry(503, "Too many concurrent logins, please retry", 1)
+
+    with _db_connect() as conn:
+        cur = conn.cursor()
+        if new_hash:
+            cur.execute(
+                "UPDATE app_users SET password_hash = ?, last_login_at = ? WHERE id = ?",
+                (new_hash, _now_iso(), user["id"]),
+            )
+        else:
+            cur.execute("UPDATE app_users SET last_login_at = ? WHERE id = ?", (_now_iso(), user["id"]))
         conn.commit()
+    invalidate_cached_user(user["id"])
 
     token = issue_access_token({"uid": user["id"], "username": user["username"], "role": user["role"]})
     return ok(
@@ -387,12 +349,18 @@ def upload_file():
     if file.filename == '':
         return fail(400, "No selected file", 400)
     try:
-        # 保存文件到指定位置
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-        filepath = Path(BASE_DIR / "videoFile" / f"{uuid_v1}_{file.filename}")
-        file.save(filepath)
-        return ok(f"{uuid_v1}_{file.filename}", "File uploaded successfully")
+        # 边写入边计算摘要，按内容存储；引用记在 file_records 中，可通过 /deleteFile 释放
+        temp_path, digest, size = materialStore.save_stream(file.stream)
+        with _db_connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            final_filename, _ = materialStore.adopt(conn, temp_path, digest, file.filename, size)
+            conn.execute(
+                "INSERT INTO file_records (filename, filesize, file_path, digest) VALUES (?, ?, ?, ?)",
+                (file.filename, round(float(size) / (1024 * 1024), 2), final_filename, digest),
+            )
+            conn.commit()
+        media_prober.notify()
+        return ok(final_filename, "File uploaded successfully")
     except Exception as e:
         return fail(500, str(e), 500)
 
@@ -408,11 +376,43 @@ def get_file():
     if '..' in filename or filename.startswith('/'):
         return fail(400, "Invalid filename", 400)
 
-    # 拼接完整路径
-    file_path = str(Path(BASE_DIR / "videoFile"))
+    # 返回文件：支持 Range（预览播放器拖动进度）、ETag/Last-Modified 与 304
+    response = serve_file(Path(BASE_DIR / "videoFile"), filename)
+    if response is None:
+        return fail(404, "File not found", 404)
+    return response
 
-    # 返回文件
-    return send_from_directory(file_path,filename)
+
+@app.route('/thumb/<int:file_id>', methods=['GET'])
+def material_thumb(file_id):
+    """
+    Poster frame (?kind=poster, default) or preview sprite (?kind=sprite) of
+    a material, ?w= picks one of THUMB_WIDTHS. Generated once, then served
+    from thumbCache/ so the material grid never pulls the videos themselves.
+    """
+    kind = request.args.get("kind", "poster")
+    if kind not in thumbnails.KINDS:
+        return fail(400, f"kind must be one of {', '.join(thumbnails.KINDS)}", 400)
+    with _db_connect() as conn:
+        row = conn.execute(
+            "SELECT id, file_path, digest, duration, probe_status FROM file_records WHERE id = ?", (file_id,)
+        ).fetchone()
+    if row is None:
+        return fail(404, "File not found", 404)
+    try:
+        path = thumbnail_cache.get(dict(row), kind, request.args.get("w"))
+    except ThumbnailPending as e:
+        # not cached anywhere: the image appears once the background probe has the duration
+        resp, status = api_response(code=202, msg=str(e), data=None, http_status=202)
+        resp.headers["Retry-After"] = "5"
+        resp.headers["Cache-Control"] = "no-store"
+        return resp, status
+    except ThumbnailUnavailable as e:
+        return fail(404, str(e), 404)
+    response = send_from_directory(str(path.parent), path.name, mimetype="image/jpeg", max_age=THUMB_MAX_AGE)
+    # the image of a record never changes, so browsers can skip revalidation entirely
+    response.headers["Cache-Control"] = f"private, max-age={THUMB_MAX_AGE}, immutable"
+    return response
 
 
 @app.route("/download/<path:filename>", methods=["GET"])
@@ -427,8 +427,10 @@ def download_file(filename: str):
     if ".." in filename or filename.startswith("/"):
         return fail(400, "Invalid filename", 400)
 
-    file_dir = str(Path(BASE_DIR / "videoFile"))
-    return send_from_directory(file_dir, filename, as_attachment=True)
+    response = serve_file(Path(BASE_DIR / "videoFile"), filename, as_attachment=True)
+    if response is None:
+        return fail(404, "File not found", 404)
+    return response
 
 
 @app.route('/uploadSave', methods=['POST'])
@@ -448,32 +450,171 @@ def upload_save():
         filename = file.filename
 
     try:
-        # 生成 UUID v1
-        uuid_v1 = uuid.uuid1()
-        print(f"UUID v1: {uuid_v1}")
-
-        # 构造文件名和路径
-        final_filename = f"{uuid_v1}_{filename}"
-        filepath = Path(BASE_DIR / "videoFile" / f"{uuid_v1}_{filename}")
-
-        # 保存文件
-        file.save(filepath)
+        # 保存文件：写入的同时计算摘要（只读一遍），内容相同的文件只存一份
+        temp_path, digest, size = materialStore.save_stream(file.stream)
 
         with _db_connect() as conn:
             cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            final_filename, duplicate = materialStore.adopt(conn, temp_path, digest, filename, size)
             cursor.execute('''
-                                INSERT INTO file_records (filename, filesize, file_path)
-            VALUES (?, ?, ?)
-                                ''', (filename, round(float(os.path.getsize(filepath)) / (1024 * 1024),2), final_filename))
+                                INSERT INTO file_records (filename, filesize, file_path, digest)
+            VALUES (?, ?, ?, ?)
+                                ''', (filename, round(float(size) / (1024 * 1024),2), final_filename, digest))
             conn.commit()
-            print("✅ 上传文件已记录")
+            print("✅ 上传文件已记录" + ("（内容已存在，复用已有文件）" if duplicate else ""))
+        # 时长、分辨率等由后台探测补全，不阻塞上传请求
+        media_prober.notify()
 
-        return ok({"filename": filename, "filepath": final_filename}, "File uploaded and saved successfully")
+        return ok(
+            {"filename": filename, "filepath": final_filename, "digest": digest, "duplicate": duplicate},
+            "File uploaded and saved successfully",
+        )
 
     except Exception as e:
         print(f"Upload failed: {e}")
         return fail(500, f"upload failed: {e}", 500)
 
+# 分片（可续传）上传：POST /uploads 创建 -> PUT /uploads/<id>?offset=N 上传分片（可并行）
+# -> GET /uploads/<id> 查询进度 -> POST /uploads/<id>/complete 完成并写入 file_records
+@app.route('/uploads', methods=['POST'])
+def upload_init():
+    user = getattr(g, "current_user", None) or {}
+    data = request.get_json(silent=True) or {}
+    original = Path(str(data.get("filename") or "")).name
+    if not original or original in (".", ".."):
+        return fail(400, "filename is required", 400)
+    custom_filename = data.get("customName")
+    filename = f"{Path(str(custom_filename)).name}.{original.split('.')[-1]}" if custom_filename else original
+
+    try:
+        with _db_connect() as conn:
+            chunkedUpload.purge_expired(conn)
+            session = chunkedUpload.create_session(conn, user.get("id"), filename, data.get("size") or 0, data.get("chunkSize"))
+            conn.commit()
+    except chunkedUpload.UploadError as e:
+        return fail(e.status, str(e), e.status)
+    return ok(session, None)
+
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    user = getattr(g, "current_user", None) or {}
+    try:
+        with _db_connect() as conn:
+            session = chunkedUpload.get_session(conn, upload_id, user.get("id"))
+            return ok(chunkedUpload.progress(conn, session), None)
+    except chunkedUpload.UploadError as e:
+        return fail(e.status, str(e), e.status)
+
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Raw chunk body (application/octet-stream) at ?offset=N; written in place, never spooled."""
+    user = getattr(g, "current_user", None) or {}
+    try:
+        with _db_connect() as conn:
+            session = chunkedUpload.get_session(conn, upload_id, user.get("id"))
+        offset = request.args.get("offset", type=int)
+        if offset is None:
+            return fail(400, "offset is required", 400)
+        index = chunkedUpload.write_chunk(session, offset, request.stream, request.content_length)
+        with _db_connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO upload_chunks (upload_id, chunk_index) VALUES (?, ?)", (upload_id, index)
+            )
+            conn.commit()
+            return ok(chunkedUpload.progress(conn, session), None)
+    except chunkedUpload.UploadError as e:
+        return fail(e.status, str(e), e.status)
+    except (OSError, sqlite3.Error) as e:
+        # the chunk is not recorded, so the client sends it again
+        print(f"⚠️ 分片写入失败 upload={upload_id}: {e}")
+        return fail(500, f"chunk write failed: {e}", 500)
+
+
+def _undo_adopt(source, session, adopted):
+    """Clean up after a complete that failed before its commit."""
+    part = chunkedUpload.video_dir() / session["file_path"]
+    try:
+        if source == part:
+            if adopted:
+                # no hard link was possible: put the file back where the session expects it
+                os.replace(chunkedUpload.video_dir() / adopted, part)
+            return
+        os.remove(source)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"⚠️ 清理临时文件失败: {e}")
+    if adopted:
+        # the file was moved into the store but its blob row was rolled back
+        try:
+            with _db_connect() as conn:
+                materialStore.remove_unreferenced(conn, adopted)
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ 清理未引用文件失败: {e}")
+
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def upload_complete(upload_id):
+    user = getattr(g, "current_user", None) or {}
+    source = adopted = None
+    try:
+        with _db_connect() as conn:
+            session = chunkedUpload.get_session(conn, upload_id, user.get("id"))
+            state = chunkedUpload.progress(conn, session)
+            if state["missing"]:
+                return api_response(code=409, msg="upload is incomplete", data=state, http_status=409)
+        # usually only the tail is still unhashed, the rest was hashed as the chunks arrived
+        digest = chunkedUpload.finish_digest(session)
+        with _db_connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # re-read under the write lock: a concurrent complete or abort may have won
+            session = chunkedUpload.get_session(conn, upload_id, user.get("id"))
+            source = chunkedUpload.adoptable(session)
+            final_filename, duplicate = materialStore.adopt(
+                conn, source, digest, session["filename"], session["size"]
+            )
+            adopted = None if duplicate else final_filename
+            # the material only becomes visible once every byte is there
+            conn.execute(
+                "INSERT INTO file_records (filename, filesize, file_path, digest) VALUES (?, ?, ?, ?)",
+                (session["filename"], round(float(session["size"]) / (1024 * 1024), 2), final_filename, digest),
+            )
+            conn.execute("DELETE FROM upload_chunks WHERE upload_id = ?", (upload_id,))
+            conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+            conn.commit()
+    except chunkedUpload.UploadError as e:
+        return fail(e.status, str(e), e.status)
+    except (OSError, sqlite3.Error) as e:
+        # rolled back: the session and its file are untouched, so complete can be retried
+        print(f"⚠️ 分片上传完成失败 upload={upload_id}: {e}")
+        if source is not None:
+            _undo_adopt(source, session, adopted)
+        return fail(500, f"upload failed: {e}", 500)
+    chunkedUpload.remove_file(session)
+    print("✅ 分片上传完成，文件已记录" + ("（内容已存在，复用已有文件）" if duplicate else ""))
+    media_prober.notify()
+    return ok(
+        {"filename": session["filename"], "filepath": final_filename, "digest": digest, "duplicate": duplicate},
+        "File uploaded and saved successfully",
+    )
+
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def upload_abort(upload_id):
+    user = getattr(g, "current_user", None) or {}
+    try:
+        with _db_connect() as conn:
+            session = chunkedUpload.get_session(conn, upload_id, user.get("id"))
+            chunkedUpload.discard(conn, session)
+            conn.commit()
+    except chunkedUpload.UploadError as e:
+        return fail(e.status, str(e), e.status)
+    return ok(None, "upload aborted")
+
+
 @app.route('/getFiles', methods=['GET'])
 def get_all_files():
     try:
@@ -489,8 +630,10 @@ def get_all_files():
             data = []
             for row in rows:
                 row_dict = dict(row)
-                # 从 file_path 中提取 UUID (文件名的第一部分，下划线前)
-                if row_dict.get('file_path'):
+                # 按内容存储的文件以摘要作为标识；旧文件从 file_path 中提取 UUID (文件名的第一部分，下划线前)
+                if row_dict.get('digest'):
+                    row_dict['uuid'] = row_dict['digest']
+                elif row_dict.get('file_path'):
                     file_path_parts = row_dict['file_path'].split('_', 1)  # 只分割第一个下划线
                     if len(file_path_parts) > 0:
                         row_dict['uuid'] = file_path_parts[0]  # UUID 部分
@@ -563,6 +706,8 @@ def delete_file():
         # 获取数据库连接
         with _db_connect() as conn:
             cursor = conn.cursor()
+            # 先拿写锁再查询：同一 id 的并发删除只有一个能看到这条记录，引用不会被重复释放
+            cursor.execute("BEGIN IMMEDIATE")
 
             # 查询要删除的记录
             cursor.execute("SELECT * FROM file_records WHERE id = ?", (file_id,))
@@ -573,6 +718,17 @@ def delete_file():
 
             record = dict(record)
 
+            if record.get('digest'):
+                # 按内容存储：只释放引用，最后一个引用删除时才删除实际文件
+                released = materialStore.release(conn, record['digest'])
+                cursor.execute("DELETE FROM file_records WHERE id = ?", (file_id,))
+                conn.commit()
+                # 提交之后才删除实际文件，回滚时不会留下指向不存在文件的记录
+                if released and materialStore.remove_unreferenced(conn, released):
+                    thumbnails.purge(record['digest'])
+                    print(f"✅ 实际文件已删除: {released}")
+                return ok({"id": record["id"], "filename": record["filename"]}, "File deleted successfully")
+
             # 获取文件路径并删除实际文件
             file_path = Path(BASE_DIR / "videoFile" / record['file_path'])
             if file_path.exists():
@@ -630,6 +786,12 @@ def login():
     # 账号名
     id = request.args.get('id')
 
+    # 浏览器资源已满且排队人数已满时直接让客户端稍后重试
+    try:
+        resource_governor.check_waiting()
+    except GovernorBusy as e:
+        return fail_retry(429, str(e), resource_governor.retry_after)
+
     # 模拟一个用于异步通信的队列
     status_queue = Queue()
     active_queues[id] = status_queue
@@ -637,9 +799,8 @@ def login():
     def on_close():
         print(f"清理队列: {id}")
         del active_queues[id]
-    # 启动异步任务线程
-    thread = threading.Thread(target=run_async_function, args=(type,id,status_queue), daemon=True)
-    thread.start()
+    # 提交登录协程到共享的 asyncio runtime
+    run_async_function(type, id, status_queue)
     response = Response(sse_stream(status_queue,), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
     response.headers['X-Accel-Buffering'] = 'no'  # 关键：禁用 Nginx 缓冲
@@ -647,211 +808,207 @@ def login():
     response.headers['Connection'] = 'keep-alive'
     return response
 
-@app.route('/postVideo', methods=['POST'])
-def postVideo():
-    user = getattr(g, "current_user", None) or {}
-    data = request.get_json(silent=True) or {}
+def parse_publish_request(data):
+    """
+    Validate one publish request body (/postVideo, or one entry of /postVideoBatch).
+    Returns the normalized fields; raises ValueError with a client-facing message.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("publish request must be an object")
 
     file_list = data.get("fileList", []) or []
     account_list = data.get("accountList", []) or []
     platform_type = data.get("type")
-    title = data.get("title") or ""
-    tags = data.get("tags") or []
-    category = data.get("category")
     enableTimer = data.get("enableTimer") or 0
 
+    category = data.get("category")
     if category == 0:
         category = None
 
-    productLink = data.get("productLink", "") or ""
-    productTitle = data.get("productTitle", "") or ""
-    thumbnail_path = data.get("thumbnail", "") or ""
-    is_draft = bool(data.get("isDraft", False))
-
-    videos_per_day = data.get("videosPerDay") or 1
-    daily_times = normalize_daily_times(data.get("dailyTimes"))
-    start_days = data.get("startDays") or 0
-
     if not isinstance(file_list, list) or not file_list:
-        return fail(400, "fileList is required", 400)
+        raise ValueError("fileList is required")
     if not isinstance(account_list, list) or not account_list:
-        return fail(400, "accountList is required", 400)
+        raise ValueError("accountList is required")
     if platform_type not in (1, 2, 3, 4):
-        return fail(400, "Invalid platform type", 400)
+        raise ValueError("Invalid platform type")
+
+    req = {
+        "file_list": file_list,
+        "account_list": account_list,
+        "platform_type": int(platform_type),
+        "title": data.get("title") or "",
+        "tags": data.get("tags") or [],
+        "category": category,
+        "enable_timer": bool(enableTimer),
+        "product_link": data.get("productLink", "") or "",
+        "product_title": data.get("productTitle", "") or "",
+        "thumbnail_path": data.get("thumbnail", "") or "",
+        "is_draft": bool(data.get("isDraft", False)),
+        # higher is dispatched first; clamped so one request cannot starve everything else forever
+        "priority": max(-PUBLISH_MAX_PRIORITY, min(PUBLISH_MAX_PRIORITY, int(data.get("priority") or 0))),
+        "videos_per_day": int(data.get("videosPerDay") or 1),
+        "daily_times": normalize_daily_times(data.get("dailyTimes")),
+        "start_days": int(data.get("startDays") or 0),
+        "preflight": bool(data.get("preflight", PREFLIGHT_ENABLED)),
+        "drop_invalid": bool(data.get("dropInvalid", False)),
+        # (file, account) pairs left out of the task, filled in by run_preflight
+        "skip_pairs": set(),
+    }
 
     # 计算每个文件的 scheduled_at（按文件维度，账号共享同一时刻）
-    scheduled_by_file = [None] * len(file_list)
-    if enableTimer:
+    req["scheduled_by_file"] = [None] * len(file_list)
+    if req["enable_timer"]:
         try:
             from utils.files_times import generate_schedule_time_next_day
 
-            scheduled_by_file = generate_schedule_time_next_day(
-                len(file_list), int(videos_per_day), daily_times, start_days=int(start_days)
+            req["scheduled_by_file"] = generate_schedule_time_next_day(
+                len(file_list), req["videos_per_day"], req["daily_times"], start_days=req["start_days"]
             )
         except Exception as e:
-            return fail(400, f"Invalid schedule params: {e}", 400)
+            raise ValueError(f"Invalid schedule params: {e}")
+    return req
+
 
-    # 创建发布任务与明细
-    task_id = None
-    item_map = {}  # (file_path, account_file_path) -> item_id
+def check_publish_backlog(new_items):
+    """429 response when accepting new_items would overflow the publish queue, else None."""
+    if not PUBLISH_MAX_QUEUED_ITEMS:
+        return None
     with _db_connect() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO publish_tasks
-              (user_id, platform_type, title, tags_json, enable_timer, videos_per_day, daily_times_json, start_days,
-               product_link, product_title, created_at, status, error_msg)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                user.get("id"),
-                int(platform_type),
-                title,
-                json.dumps(tags, ensure_ascii=False),
-                int(bool(enableTimer)),
-                int(videos_per_day),
-                json.dumps(daily_times, ensure_ascii=False) if daily_times is not None else None,
-                int(start_days),
-                productLink,
-                productTitle,
-                _now_iso(),
-                "running",
-                None,
-            ),
-        )
-        task_id = cur.lastrowid
+        row = conn.execute(
+            "SELECT COUNT(1) FROM publish_task_items WHERE status IN ('pending', 'deferred')"
+        ).fetchone()
+    if int(row[0]) + new_items > PUBLISH_MAX_QUEUED_ITEMS:
+        return fail_retry(429, f"发布队列已满（{row[0]} 个条目等待中），请稍后重试", resource_governor.retry_after)
+    return None
 
-        for idx, file_path in enumerate(file_list):
-            scheduled_at = scheduled_by_file[idx] if enableTimer else None
-            if isinstance(scheduled_at, dt.datetime):
-                scheduled_at = scheduled_at.replace(microsecond=0).isoformat()
-            else:
-                scheduled_at = None
-
-            for account_file_path in account_list:
-                status = "scheduled" if scheduled_at else "pending"
-                cur.execute(
-                    """
-                    INSERT INTO publish_task_items
-                      (task_id, file_path, account_file_path, scheduled_at, started_at, finished_at, status, result_msg)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (task_id, str(file_path), str(account_file_path), scheduled_at, None, None, status, None),
-                )
-                item_map[(str(file_path), str(account_file_path))] = cur.lastrowid
 
-        conn.commit()
+def run_preflight(req):
+    """
+    Pre-flight check of every (file, account) pair when the request asks for it.
+    Returns (report or None, error message or None); with dropInvalid the bad
+    pairs are recorded in req["skip_pairs"] instead of failing the request.
+    """
+    if not req["preflight"]:
+        return None, None
+    report = preflight(req["platform_type"], req["file_list"], req["account_list"])
+    if report["ok"]:
+        return report, None
+    if not req["drop_invalid"]:
+        return report, f"预检未通过：{report['invalid']} 个发布条目无效"
+    if not report["valid"]:
+        return report, "预检未通过：没有可发布的条目"
+    req["skip_pairs"] = invalid_pairs(report)
+    return report, None
+
+
+def insert_publish_task(cur, user, req, batch_id=None):
+    """
+    Insert one publish_tasks row plus its file x account items.
+    Returns (task_id, item_count, [(item_id, scheduled_at), ...] for scheduled items).
+    """
+    cur.execute(
+        """
+        INSERT INTO publish_tasks
+          (user_id, platform_type, title, tags_json, enable_timer, videos_per_day, daily_times_json, start_days,
+           product_link, product_title, category, is_draft, thumbnail_path, batch_id, priority, created_at, status,
+           error_msg)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            user.get("id"),
+            req["platform_type"],
+            req["title"],
+            json.dumps(req["tags"], ensure_ascii=False),
+            int(req["enable_timer"]),
+            req["videos_per_day"],
+            json.dumps(req["daily_times"], ensure_ascii=False) if req["daily_times"] is not None else None,
+            req["start_days"],
+            req["product_link"],
+            req["product_title"],
+            req["category"],
+            int(req["is_draft"]),
+            req["thumbnail_path"],
+            batch_id,
+            req["priority"],
+            _now_iso(),
+            "running",
+            None,
+        ),
+    )
+    task_id = cur.lastrowid
+
+    total_cnt = 0
+    scheduled_items = []
+    for idx, file_path in enumerate(req["file_list"]):
+        scheduled_at = req["scheduled_by_file"][idx] if req["enable_timer"] else None
+        if isinstance(scheduled_at, dt.datetime):
+            scheduled_at = scheduled_at.replace(microsecond=0).isoformat()
+        else:
+            scheduled_at = None
 
-    def reporter(file_path, account_file_path, status, scheduled_at=None, result_msg=None):
-        item_id = item_map.get((str(file_path), str(account_file_path)))
-        if not item_id:
-            return
+        for account_file_path in req["account_list"]:
+            if (str(file_path), str(account_file_path)) in req["skip_pairs"]:
+                continue
+            status = "scheduled" if scheduled_at else "pending"
+            cur.execute(
+                """
+                INSERT INTO publish_task_items
+                  (task_id, file_path, account_file_path, scheduled_at, started_at, finished_at, status, result_msg)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (task_id, str(file_path), str(account_file_path), scheduled_at, None, None, status, None),
+            )
+            total_cnt += 1
+            if scheduled_at:
+                scheduled_items.append((cur.lastrowid, scheduled_at))
+
+    return task_id, total_cnt, scheduled_items
 
-        now = _now_iso()
-        with _db_connect() as conn:
-            cur = conn.cursor()
-            if status == "running":
-                cur.execute(
-                    "UPDATE publish_task_items SET status = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
-                    ("running", now, item_id),
-                )
-            elif status in ("success", "failed"):
-                cur.execute(
-                    "UPDATE publish_task_items SET status = ?, finished_at = ?, result_msg = ? WHERE id = ?",
-                    (status, now, result_msg, item_id),
-                )
-            else:
-                cur.execute("UPDATE publish_task_items SET status = ?, result_msg = ? WHERE id = ?", (status, result_msg, item_id))
-            conn.commit()
 
-    # 执行发布（同步执行，沿用现有实现）
+def dispatch_new_items(scheduled_items):
+    # 定时条目交给调度器到点再放入队列，其余立即唤醒 worker
+    for item_id, scheduled_at in scheduled_items:
+        schedule_dispatcher.add(item_id, scheduled_at)
+    publish_queue.notify()
+
+
+@app.route('/postVideo', methods=['POST'])
+def postVideo():
+    user = getattr(g, "current_user", None) or {}
+    data = request.get_json(silent=True) or {}
+
     try:
-        if platform_type == 1:
-            post_video_xhs(
-                title,
-                file_list,
-                tags,
-                account_list,
-                category,
-                bool(enableTimer),
-                int(videos_per_day),
-                daily_times,
-                int(start_days),
-                reporter=reporter,
-            )
-        elif platform_type == 2:
-            post_video_tencent(
-                title,
-                file_list,
-                tags,
-                account_list,
-                category,
-                bool(enableTimer),
-                int(videos_per_day),
-                daily_times,
-                int(start_days),
-                is_draft,
-                reporter=reporter,
-            )
-        elif platform_type == 3:
-            post_video_DouYin(
-                title,
-                file_list,
-                tags,
-                account_list,
-                category,
-                bool(enableTimer),
-                int(videos_per_day),
-                daily_times,
-                int(start_days),
-                thumbnail_path,
-                productLink,
-                productTitle,
-                reporter=reporter,
-            )
-        elif platform_type == 4:
-            post_video_ks(
-                title,
-                file_list,
-                tags,
-                account_list,
-                category,
-                bool(enableTimer),
-                int(videos_per_day),
-                daily_times,
-                int(start_days),
-                reporter=reporter,
-            )
-    except Exception as e:
-        with _db_connect() as conn:
-            cur = conn.cursor()
-            cur.execute("UPDATE publish_tasks SET status = ?, error_msg = ? WHERE id = ?", ("failed", str(e), task_id))
-            conn.commit()
-        return fail(500, f"publish failed: {e}", 500)
+        req = parse_publish_request(data)
+    except ValueError as e:
+        return fail(400, str(e), 400)
 
-    # 汇总任务状态
+    busy = check_publish_backlog(len(req["file_list"]) * len(req["account_list"]))
+    if busy:
+        return busy
+
+    # 预检在占用任何上传槽位之前完成
+    report, error = run_preflight(req)
+    if error:
+        return api_response(code=400, msg=error, data={"preflight": report}, http_status=400)
+
+    # 创建发布任务与明细，实际上传由后台发布队列完成
     with _db_connect() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT
-              SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) AS success_cnt,
-              SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) AS failed_cnt,
-              COUNT(1) AS total_cnt
-            FROM publish_task_items
-            WHERE task_id = ?
-            """,
-            (task_id,),
-        )
-        r = cur.fetchone()
-        success_cnt = int(r["success_cnt"] or 0)
-        failed_cnt = int(r["failed_cnt"] or 0)
-        total_cnt = int(r["total_cnt"] or 0)
-        final_status = "failed" if failed_cnt > 0 else "success"
-        cur.execute("UPDATE publish_tasks SET status = ? WHERE id = ?", (final_status, task_id))
+        task_id, total_cnt, scheduled_items = insert_publish_task(conn.cursor(), user, req)
         conn.commit()
 
-    return ok({"task_id": task_id, "total": total_cnt, "success": success_cnt, "failed": failed_cnt}, None)
+    dispatch_new_items(scheduled_items)
+    return ok({"task_id": task_id, "total": total_cnt, "status": "running", "preflight": report}, "queued")
+
+
+@app.route('/publish/preflight', methods=['POST'])
+def publish_preflight():
+    """Run the pre-flight checks for a /postVideo body without creating anything."""
+    data = request.get_json(silent=True) or {}
+    try:
+        req = parse_publish_request(data)
+    except ValueError as e:
+        return fail(400, str(e), 400)
+    return ok(preflight(req["platform_type"], req["file_list"], req["account_list"]), None)
 
 
 @app.route('/updateUserinfo', methods=['POST'])
@@ -884,61 +1041,108 @@ def updateUserinfo():
 
 @app.route('/postVideoBatch', methods=['POST'])
 def postVideoBatch():
-    data_list = request.get_json()
+    """
+    Turn a JSON array of publish requests into one tracked batch.
+    Each entry becomes its own publish task; the queue runs different platforms
+    side by side, so the batch takes about as long as its slowest platform.
+    """
+    user = getattr(g, "current_user", None) or {}
+    data_list = request.get_json(silent=True)
 
-    if not isinstance(data_list, list):
+    if not isinstance(data_list, list) or not data_list:
         return fail(400, "Expected a JSON array", 400)
-    for data in data_list:
-        # 从JSON数据中提取fileList和accountList
-        file_list = data.get('fileList', [])
-        account_list = data.get('accountList', [])
-        type = data.get('type')
-        title = data.get('title')
-        tags = data.get('tags')
-        category = data.get('category')
-        enableTimer = data.get('enableTimer')
-        if category == 0:
-            category = None
-        productLink = data.get('productLink', '')
-        productTitle = data.get('productTitle', '')
-
-        videos_per_day = data.get('videosPerDay')
-        daily_times = data.get('dailyTimes')
-        start_days = data.get('startDays')
-        # 打印获取到的数据（仅作为示例）
-        print("File List:", file_list)
-        print("Account List:", account_list)
-        if type == 2:
-            post_video_tencent(
-                title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days
-            )
-        elif type == 3:
-            post_video_DouYin(
-                title,
-                file_list,
-                tags,
-                account_list,
-                category,
-                enableTimer,
-                videos_per_day,
-                daily_times,
-                start_days,
-                productLink,
-                productTitle,
-            )
-        elif type == 4:
-            post_video_ks(
-                title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days
-            )
-        elif type == 1:
-            # TODO: batch xhs if needed
-            post_video_xhs(
-                title, file_list, tags, account_list, category, enableTimer, videos_per_day, daily_times, start_days
-            )
-        else:
-            return fail(400, "Invalid platform type", 400)
 
-    return ok(None, None)
+    # validate everything before creating anything
+    reqs = []
+    for idx, data in enumerate(data_list):
+        try:
+            reqs.append(parse_publish_request(data))
+        except ValueError as e:
+            return fail(400, f"item {idx}: {e}", 400)
+
+    busy = check_publish_backlog(sum(len(r["file_list"]) * len(r["account_list"]) for r in reqs))
+    if busy:
+        return busy
+
+    reports = []
+    for idx, req in enumerate(reqs):
+        report, error = run_preflight(req)
+        reports.append(report)
+        if error:
+            return api_response(code=400, msg=f"item {idx}: {error}", data={"preflight": reports}, http_status=400)
+
+    task_ids = []
+    total_cnt = 0
+    scheduled_items = []
+    with _db_connect() as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO publish_batches (user_id, created_at) VALUES (?, ?)", (user.get("id"), _now_iso()))
+        batch_id = cur.lastrowid
+        for req in reqs:
+            task_id, cnt, scheduled = insert_publish_task(cur, user, req, batch_id=batch_id)
+            task_ids.append(task_id)
+            total_cnt += cnt
+            scheduled_items.extend(scheduled)
+        conn.commit()
+
+    dispatch_new_items(scheduled_items)
+    return ok(
+        {"batch_id": batch_id, "task_ids": task_ids, "total": total_cnt, "status": "running", "preflight": reports},
+        "queued",
+    )
+
+
+@app.route("/publish_batches/<int:batch_id>", methods=["GET"])
+def get_publish_batch(batch_id: int):
+    with _db_connect() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM publish_batches WHERE id = ?", (batch_id,))
+        batch = cur.fetchone()
+        if not batch:
+            return fail(404, "batch not found", 404)
+
+        cur.execute(
+            """
+            SELECT
+              t.id, t.platform_type, t.title, t.status,
+              COUNT(i.id) AS items_total,
+              SUM(CASE WHEN i.status = 'success' THEN 1 ELSE 0 END) AS items_success,
+              SUM(CASE WHEN i.status = 'failed' THEN 1 ELSE 0 END) AS items_failed,
+              SUM(CASE WHEN i.status = 'running' THEN 1 ELSE 0 END) AS items_running,
+              SUM(CASE WHEN i.status = 'cancelled' THEN 1 ELSE 0 END) AS items_cancelled
+            FROM publish_tasks t
+            LEFT JOIN publish_task_items i ON i.task_id = t.id
+            WHERE t.batch_id = ?
+            GROUP BY t.id
+            ORDER BY t.id ASC
+            """,
+            (batch_id,),
+        )
+        tasks = [dict(r) for r in cur.fetchall()]
+
+    progress = {"total": 0, "success": 0, "failed": 0, "running": 0, "cancelled": 0}
+    for t in tasks:
+        progress["total"] += int(t["items_total"] or 0)
+        progress["success"] += int(t["items_success"] or 0)
+        progress["failed"] += int(t["items_failed"] or 0)
+        progress["running"] += int(t["items_running"] or 0)
+        progress["cancelled"] += int(t["items_cancelled"] or 0)
+    # cancelled items will never run, so they count as done
+    done = progress["success"] + progress["failed"] + progress["cancelled"]
+    progress["percent"] = round(done * 100.0 / progress["total"], 1) if progress["total"] else 100.0
+
+    statuses = {t["status"] for t in tasks}
+    if statuses & {"running", "created", "paused"}:
+        status = "running"
+    elif "failed" in statuses:
+        status = "failed"
+    elif "cancelled" in statuses:
+        # everything cancelled, or some tasks published and the rest cancelled
+        status = "partial" if "success" in statuses else "cancelled"
+    else:
+        status = "success"
+
+    return ok({"batch": dict(batch), "status": status, "progress": progress, "tasks": tasks}, None)
 
 # Cookie文件上传API
 @app.route('/uploadCookie', methods=['POST'])
@@ -1083,8 +1287,109 @@ def get_publish_task(task_id: int):
 
         cur.execute("SELECT * FROM publish_task_items WHERE task_id = ? ORDER BY id ASC", (task_id,))
         items = [dict(r) for r in cur.fetchall()]
+        queue = fair_order.queue_position(cur, task_id, PUBLISH_MAX_CONCURRENCY)
 
-    return ok({"task": dict(task), "items": items}, None)
+    return ok({"task": dict(task), "items": items, "queue": queue}, None)
+
+
+@app.route("/publish_tasks/<int:task_id>/retry", methods=["POST"])
+def retry_publish_task(task_id: int):
+    """Requeue only the failed items of a task; successful items are left alone."""
+    with _db_connect() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM publish_tasks WHERE id = ?", (task_id,))
+        if not cur.fetchone():
+            return fail(404, "task not found", 404)
+
+        cur.execute(
+            """
+            UPDATE publish_task_items
+            SET status = 'pending', attempts = 0, next_attempt_at = NULL, finished_at = NULL, result_msg = NULL
+            WHERE task_id = ? AND status = 'failed'
+            """,
+            (task_id,),
+        )
+        requeued = cur.rowcount
+        if requeued:
+            cur.execute("UPDATE publish_tasks SET status = ?, error_msg = NULL WHERE id = ?", ("running", task_id))
+        conn.commit()
+
+    if requeued:
+        publish_queue.notify()
+    return ok({"task_id": task_id, "requeued": requeued}, None)
+
+
+@app.route("/publish_tasks/<int:task_id>/cancel", methods=["POST"])
+def cancel_publish_task(task_id: int):
+    """
+    Cancel every item that has not finished yet.
+    Waiting items are cancelled right away; workers notice their running items
+    were cancelled within a few seconds and abort the upload if it has not
+    reached the platform's publish step yet. An upload that is already
+    publishing finishes, and a success is recorded over the cancel.
+    """
+    with _db_connect() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT id FROM publish_tasks WHERE id = ?", (task_id,))
+        if not cur.fetchone():
+            conn.rollback()
+            return fail(404, "task not found", 404)
+
+        cur.execute(
+            "SELECT COUNT(1) FROM publish_task_items WHERE task_id = ? AND status = 'running'",
+            (task_id,),
+        )
+        running = int(cur.fetchone()[0])
+        cur.execute(
+            """
+            UPDATE publish_task_items
+            SET status = 'cancelled', finished_at = ?, result_msg = 'cancelled by user'
+            WHERE task_id = ? AND status IN ('pending', 'scheduled', 'deferred', 'running')
+            """,
+            (_now_iso(), task_id),
+        )
+        cancelled = cur.rowcount
+        cur.execute("UPDATE publish_tasks SET paused = 0 WHERE id = ?", (task_id,))
+        refresh_task_status(conn, task_id)
+        conn.commit()
+
+    return ok({"task_id": task_id, "cancelled": cancelled, "aborting": running}, None)
+
+
+def _set_task_paused(task_id: int, paused: bool):
+    with _db_connect() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT status, paused FROM publish_tasks WHERE id = ?", (task_id,))
+        task = cur.fetchone()
+        if not task:
+            return fail(404, "task not found", 404)
+        if paused and task["status"] not in ("created", "running"):
+            return fail(409, f"task is {task['status']}", 409)
+        if not paused and not task["paused"]:
+            return fail(409, "task is not paused", 409)
+        cur.execute(
+            "UPDATE publish_tasks SET paused = ?, status = ? WHERE id = ?",
+            (int(paused), "paused" if paused else "running", task_id),
+        )
+        # items may all have finished while the task was paused
+        refresh_task_status(conn, task_id)
+        conn.commit()
+
+    if not paused:
+        publish_queue.notify()
+    return ok({"task_id": task_id, "paused": paused}, None)
+
+
+@app.route("/publish_tasks/<int:task_id>/pause", methods=["POST"])
+def pause_publish_task(task_id: int):
+    """Stop claiming the task's items; uploads already running are allowed to finish."""
+    return _set_task_paused(task_id, True)
+
+
+@app.route("/publish_tasks/<int:task_id>/resume", methods=["POST"])
+def resume_publish_task(task_id: int):
+    return _set_task_paused(task_id, False)
 
 
 @app.route("/stats/summary", methods=["GET"])
@@ -1099,11 +1404,19 @@ def stats_summary():
         acc_normal = int(acc["normal"] or 0)
         acc_abnormal = acc_total - acc_normal
 
-        # materials
-        cur.execute("SELECT COUNT(1) AS total, SUM(filesize) AS total_size_mb FROM file_records")
+        # materials: identical content is stored (and counted) once, references = file_records rows
+        cur.execute(
+            """
+            SELECT COUNT(1) AS total, SUM(filesize) AS total_size_mb, SUM(refs) AS refs FROM (
+              SELECT MAX(filesize) AS filesize, COUNT(1) AS refs FROM file_records
+              GROUP BY COALESCE(digest, 'id:' || id)
+            )
+            """
+        )
         mat = cur.fetchone()
         mat_total = int(mat["total"] or 0)
         mat_size = float(mat["total_size_mb"] or 0.0)
+        mat_refs = int(mat["refs"] or 0)
 
         # publish tasks/items
         cur.execute("SELECT COUNT(1) AS total, SUM(CASE WHEN status='success' THEN 1 ELSE 0 END) AS success, SUM(CASE WHEN status='failed' THEN 1 ELSE 0 END) AS failed FROM publish_tasks")
@@ -1112,19 +1425,20 @@ def stats_summary():
         task_success = int(pt["success"] or 0)
         task_failed = int(pt["failed"] or 0)
 
-        cur.execute("SELECT SUM(CASE WHEN status='success' THEN 1 ELSE 0 END) AS success, SUM(CASE WHEN status='failed' THEN 1 ELSE 0 END) AS failed, SUM(CASE WHEN status='running' THEN 1 ELSE 0 END) AS running, SUM(CASE WHEN status='scheduled' THEN 1 ELSE 0 END) AS scheduled FROM publish_task_items")
+        cur.execute("SELECT SUM(CASE WHEN status='success' THEN 1 ELSE 0 END) AS success, SUM(CASE WHEN status='failed' THEN 1 ELSE 0 END) AS failed, SUM(CASE WHEN status='running' THEN 1 ELSE 0 END) AS running, SUM(CASE WHEN status='scheduled' THEN 1 ELSE 0 END) AS scheduled, SUM(CASE WHEN status='deferred' THEN 1 ELSE 0 END) AS deferred FROM publish_task_items")
         pi = cur.fetchone()
         item_stats = {
             "success": int(pi["success"] or 0),
             "failed": int(pi["failed"] or 0),
             "running": int(pi["running"] or 0),
             "scheduled": int(pi["scheduled"] or 0),
+            "deferred": int(pi["deferred"] or 0),
         }
 
     return ok(
         {
             "accounts": {"total": acc_total, "normal": acc_normal, "abnormal": acc_abnormal},
-            "materials": {"total": mat_total, "total_size_mb": round(mat_size, 2)},
+            "materials": {"total": mat_total, "total_size_mb": round(mat_size, 2), "references": mat_refs},
             "publish_tasks": {"total": task_total, "success": task_success, "failed": task_failed},
             "publish_items": item_stats,
         },
@@ -1162,30 +1476,58 @@ def stats_uploads_trend():
     return ok(rows, None)
 
 
-# 包装函数：在线程中运行异步函数
+@app.route("/stats/runtime", methods=["GET"])
+def stats_runtime():
+    """In-process counters for tuning: caches, concurrency slots, rate limits, breakers."""
+    with _db_connect() as conn:
+        rate_buckets = publish_rate_limiter.snapshot(conn.cursor())
+        breakers = publish_breaker.snapshot(conn.cursor())
+    return ok(
+        {
+            "auth_cache": auth_cache.stats(),
+            "publish_limits": publish_limiter.snapshot(),
+            "scheduler": {"waiting": schedule_dispatcher.pending_count(), "next_due": schedule_dispatcher.next_due()},
+            "status_writer": publish_queue.writer.stats(),
+            "rate_buckets": rate_buckets,
+            "circuit_breakers": breakers,
+            "resources": resource_governor.stats(),
+            "media_probe": media_prober.stats(),
+            "thumbnails": thumbnail_cache.stats(),
+        },
+        None,
+    )
+
+
+# 登录协程统一提交到常驻的 asyncio runtime，不再每次新建事件循环
+LOGIN_FUNCS = {
+    '1': xiaohongshu_cookie_gen,
+    '2': get_tencent_cookie,
+    '3': douyin_cookie_gen,
+    '4': get_ks_cookie,
+}
+
+
 def run_async_function(type,id,status_queue):
-    if type == '1':
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(xiaohongshu_cookie_gen(id, status_queue))
-        loop.close()
-    elif type == '2':
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(get_tencent_cookie(id,status_queue))
-        loop.close()
-    elif type == '3':
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(douyin_cookie_gen(id,status_queue))
-        loop.close()
-    elif type == '4':
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(get_ks_cookie(id,status_queue))
-        loop.close()
-    else:
+    login_func = LOGIN_FUNCS.get(type)
+    if login_func is None:
         status_queue.put("500")
+        return None
+    return async_runtime.submit(_governed_login(login_func, id, status_queue))
+
+
+async def _governed_login(login_func, id, status_queue):
+    # a login opens its own browser, so it waits for room like an upload does
+    await resource_governor.acquire_async("login")
+    try:
+        return await login_func(id, status_queue)
+    finally:
+        resource_governor.release("login")
+
+publish_queue = PublishQueue(_db_connect, workers=PUBLISH_WORKERS)
+schedule_dispatcher = ScheduleDispatcher(_db_connect, on_due=publish_queue.notify)
+# 探测完成后顺带生成封面与预览雪碧图
+media_prober = MediaProber(_db_connect, on_probed=thumbnail_cache.warm)
+
 
 # SSE 流生成器函数
 def sse_stream(status_queue):
@@ -1197,5 +1539,35 @@ def sse_stream(status_queue):
             # 避免 CPU 占满
             time.sleep(0.1)
 
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def init_app():
+    """
+    Process start-up: bring the schema up to date once, then start background
+    workers. Safe to call more than once; only the first call in a process
+    does anything. `python sau_backend.py` and wsgi.py both call it.
+    """
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        _initialized = True
+    with _db_connect() as conn:
+        applied = migrate(conn)
+    if applied:
+        print(f"✅ 数据库迁移完成: {applied}")
+    if PUBLISH_EMBEDDED_WORKERS:
+        publish_queue.start()
+    else:
+        print("ℹ️ 未启动内置发布 worker，请运行 python -m sau_worker")
+    # releasing due scheduled items needs no browser, so it stays with the API process
+    schedule_dispatcher.start()
+    # probes new materials and backfills rows uploaded before the probe columns existed
+    media_prober.start()
+
+
 if __name__ == '__main__':
+    init_app()
     app.run(host='0.0.0.0' ,port=5409)
@@ -1,5 +1,62 @@
 import { http } from '@/utils/request'
 
+// 分片上传：同时上传的分片数；未完成的上传记录在 localStorage，重新上传同一文件时只补传缺失分片
+const UPLOAD_PARALLEL_CHUNKS = 3
+const uploadKey = (file, filename) => `upload:${file.name}:${file.size}:${file.lastModified}:${filename || ''}`
+
+const startOrResumeUpload = async (file, filename) => {
+  const key = uploadKey(file, filename)
+  const saved = localStorage.getItem(key)
+  if (saved) {
+    try {
+      const res = await http.get(`/uploads/${saved}`)
+      return res.data
+    } catch (e) {
+      localStorage.removeItem(key)
+    }
+  }
+  const res = await http.post('/uploads', { filename: file.name, size: file.size, customName: filename || undefined })
+  localStorage.setItem(key, res.data.upload_id)
+  return { ...res.data, missing: [...Array(res.data.total_chunks).keys()] }
+}
+
+const chunkedUpload = async (file, filename, onUploadProgress) => {
+  const session = await startOrResumeUpload(file, filename)
+  const { upload_id: uploadId, chunk_size: chunkSize } = session
+  const loadedByChunk = {}
+  let doneBytes = file.size - session.missing.reduce((sum, i) => sum + Math.min(chunkSize, file.size - i * chunkSize), 0)
+  const report = () => {
+    if (!onUploadProgress) return
+    const loaded = doneBytes + Object.values(loadedByChunk).reduce((a, b) => a + b, 0)
+    onUploadProgress({ loaded, total: file.size, progress: loaded / file.size })
+  }
+
+  const pending = [...session.missing]
+  const worker = async () => {
+    while (pending.length) {
+      const index = pending.shift()
+      const start = index * chunkSize
+      const blob = file.slice(start, Math.min(start + chunkSize, file.size))
+      await http.put(`/uploads/${uploadId}`, blob, {
+        params: { offset: start },
+        headers: { 'Content-Type': 'application/octet-stream' },
+        onUploadProgress: (e) => {
+          loadedByChunk[index] = e.loaded
+          report()
+        }
+      })
+      delete loadedByChunk[index]
+      doneBytes += blob.size
+      report()
+    }
+  }
+  await Promise.all(Array.from({ length: Math.min(UPLOAD_PARALLEL_CHUNKS, pending.length) }, worker))
+
+  const res = await http.post(`/uploads/${uploadId}/complete`)
+  localStorage.removeItem(uploadKey(file, filename))
+  return res
+}
+
 // 素材管理API
 export const materialApi = {
   // 获取所有素材
@@ -7,10 +64,14 @@ export const materialApi = {
     return http.get('/getFiles')
   },
   
-  // 上传素材
+  // 上传素材：分片并行上传，失败后再次上传同一文件会从断点续传（返回值与 /uploadSave 相同）
   uploadMaterial: (formData, onUploadProgress) => {
-    // 使用http.upload方法，它已经配置了正确的Content-Type
-    return http.upload('/uploadSave', formData, onUploadProgress)
+    return chunkedUpload(formData.get('file'), formData.get('filename'), onUploadProgress)
+  },
+
+  // 放弃一个未完成的分片上传
+  abortUpload: (uploadId) => {
+    return http.delete(`/uploads/${uploadId}`)
   },
   
   // 删除素材
@@ -30,5 +91,13 @@ export const materialApi = {
     const base = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5409'
     const token = encodeURIComponent(localStorage.getItem('token') || '')
     return `${base}/getFile?filename=${encodeURIComponent(filename)}&token=${token}`
+  },
+
+  // 获取素材缩略图URL：kind 为 poster（封面）或 sprite（预览雪碧图），浏览器会长期缓存
+  getMaterialThumbUrl: (id, kind = 'poster', width) => {
+    const base = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5409'
+    const token = encodeURIComponent(localStorage.getItem('token') || '')
+    const size = width ? `&w=${width}` : ''
+    return `${base}/thumb/${id}?kind=${kind}${size}&token=${token}`
   }
 }
\ No newline at end of file
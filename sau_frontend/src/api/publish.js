@@ -6,5 +6,26 @@ export const publishApi = {
   },
   getTask(taskId) {
     return http.get(`/publish_tasks/${taskId}`)
+  },
+  retryTask(taskId) {
+    return http.post(`/publish_tasks/${taskId}/retry`)
+  },
+  cancelTask(taskId) {
+    return http.post(`/publish_tasks/${taskId}/cancel`)
+  },
+  pauseTask(taskId) {
+    return http.post(`/publish_tasks/${taskId}/pause`)
+  },
+  resumeTask(taskId) {
+    return http.post(`/publish_tasks/${taskId}/resume`)
+  },
+  preflight(data) {
+    return http.post('/publish/preflight', data)
+  },
+  publishBatch(requests) {
+    return http.post('/postVideoBatch', requests)
+  },
+  getBatch(batchId) {
+    return http.get(`/publish_batches/${batchId}`)
   }
 }
@@ -0,0 +1,79 @@
+"""
+Standalone publish worker.
+
+    python -m sau_worker [--workers N] [--poll SECONDS]
+
+Claims publish_task_items from the shared database and runs the uploads,
+exactly like the workers embedded in sau_backend.py. Start as many of these
+as the machine can carry browsers for, and set PUBLISH_EMBEDDED_WORKERS =
+False in conf.py so the API process only enqueues. Claims, leases, rate
+limits and circuit breakers all live in the database, so the processes
+coordinate through it; each one stops claiming on SIGINT / SIGTERM and lets
+its uploads finish.
+
+All processes must run on the host that holds database.db: SQLite's WAL
+index is shared memory, and its locks are unreliable over NFS / SMB, so
+the worker refuses to start when the database is on a network filesystem.
+Spreading workers over several machines needs a different store.
+"""
+import argparse
+import signal
+import sys
+import threading
+
+import conf
+from myUtils.db import DB_PATH, connect, network_filesystem
+from myUtils.migrations import migrate
+from myUtils.publishLimits import PUBLISH_MAX_CONCURRENCY
+from myUtils.publishQueue import PublishQueue
+
+# 新条目没有跨进程唤醒，独立 worker 靠轮询发现（秒）
+PUBLISH_WORKER_POLL_INTERVAL = getattr(conf, "PUBLISH_WORKER_POLL_INTERVAL", 2.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sau_worker", description="Run publish workers against the shared database.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=getattr(conf, "PUBLISH_WORKERS", PUBLISH_MAX_CONCURRENCY),
+        help="worker threads in this process (default: PUBLISH_WORKERS)",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=PUBLISH_WORKER_POLL_INTERVAL,
+        help="seconds between claim attempts while idle",
+    )
+    args = parser.parse_args(argv)
+
+    fs_type = network_filesystem(DB_PATH)
+    if fs_type:
+        print(f"❌ 数据库 {DB_PATH} 位于网络文件系统 ({fs_type})，SQLite WAL 不支持跨主机共享，worker 必须与数据库在同一台机器上运行")
+        sys.exit(1)
+
+    with connect() as conn:
+        applied = migrate(conn)
+    if applied:
+        print(f"✅ 数据库迁移完成: {applied}")
+
+    queue = PublishQueue(connect, workers=args.workers, poll_interval=args.poll)
+    stopped = threading.Event()
+
+    def _stop(signum, frame):
+        print(f"🛑 收到信号 {signum}，停止领取新条目，等待进行中的上传完成...")
+        stopped.set()
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    queue.start()
+    while not stopped.wait(1.0):
+        pass
+    queue.stop()
+    queue.join()
+    print(f"✅ worker {queue.owner} 已退出")
+
+
+if __name__ == "__main__":
+    main()
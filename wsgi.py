@@ -0,0 +1,17 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -w 1 --threads 16 -b 0.0.0.0:5409 wsgi:app
+
+Importing sau_backend only builds the Flask app; this module also runs
+init_app() so the schema is migrated and the publish workers, schedule
+dispatcher and media prober start. Do not use gunicorn's --preload: the
+background threads would start in the master and not survive the fork.
+Each additional worker process (-w) runs its own publish workers, which
+coordinate through the database like sau_worker processes do.
+"""
+from sau_backend import app, init_app
+
+init_app()
+
+__all__ = ["app"]